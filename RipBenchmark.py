@@ -0,0 +1,407 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import struct
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+
+# Needed for stand-alone use, this is never imported by the add-on itself
+if __package__:
+   from .RipFile import RipFile
+   from .RipShader import RipShader, RipNode
+else:
+   from RipFile import RipFile
+   from RipShader import RipShader, RipNode
+
+typeLetters = {'f': 0, 'u': 1, 's': 2}
+defaultSemantics = "POSITION:3f,NORMAL:4f,TEXCOORD:2f,TEXCOORD:2f,BLENDINDICES:4u,BLENDWEIGHT:4f"
+
+def parseSemantics(spec):
+   """Turns a semantic spec like "POSITION:3f,NORMAL:4f,BLENDINDICES:4u" into a list of (name, index, types)
+   
+   The letters f, u and s stand for FLOAT, UINT and SINT. Repeated names get increasing indices, like TEXCOORD0 and TEXCOORD1.
+   """
+   
+   semantics = []
+   counts = {}
+   for part in spec.split(","):
+      name, layout = part.strip().split(":")
+      count = int(layout[:-1])
+      index = counts.get(name, 0)
+      counts[name] = index + 1
+      semantics.append((name, index, [typeLetters[layout[-1]]] * count))
+   return semantics
+
+def writeRip(filePath, vertexCount, faceCount, semantics, textures=(), shaders=(), seed=0):
+   """Writes a synthetic version 4 RIP file
+   
+   Parameters
+   ----------
+   filePath : str
+      where to write the file
+   vertexCount, faceCount : int
+      how many vertices and triangles to generate
+   semantics : list[tuple]
+      (name, index, types) for each semantic, see parseSemantics
+   textures, shaders : list[str]
+      file names for the texture and shader tables
+   seed : int
+      seed for the random vertex data, so files can be reproduced
+   """
+   
+   rand = random.Random(seed)
+   header = bytearray()
+   offset = 0
+   for name, index, types in semantics:
+      header += name.encode() + b"\0"
+      header += struct.pack("<LLLL", index, offset, 4 * len(types), len(types))
+      header += struct.pack("<" + "L" * len(types), *types)
+      offset += 4 * len(types)
+   vertexSize = offset
+   for name in list(textures) + list(shaders):
+      header += name.encode() + b"\0"
+   
+   with open(filePath, 'wb') as file:
+      file.write(struct.pack("<LLLLLLLL", 3735929054, 4, faceCount, vertexCount, vertexSize, len(textures), len(shaders), len(semantics)))
+      file.write(header)
+      # Generated in blocks so even huge files don't need all of their data in memory at once
+      block = 65536
+      for start in range(0, faceCount, block):
+         count = min(block, faceCount - start)
+         indices = [rand.randrange(max(vertexCount, 1)) for i in range(count * 3)]
+         file.write(struct.pack("<{}L".format(count * 3), *indices))
+      vertexFormat = "<" + "".join("fLl"[t] for name, index, types in semantics for t in types)
+      generators = [
+         lambda: rand.uniform(-10.0, 10.0),
+         lambda: rand.randrange(256),
+         lambda: rand.randrange(-256, 256),
+      ]
+      components = [generators[t] for name, index, types in semantics for t in types]
+      for start in range(0, vertexCount, block):
+         count = min(block, vertexCount - start)
+         data = bytearray()
+         for i in range(count):
+            data += struct.pack(vertexFormat, *[generate() for generate in components])
+         file.write(data)
+
+def writeShader(filePath, lineCount, textureCount=2, seed=0):
+   """Writes a synthetic pixel shader in the assembly listing format NinjaRipper dumps
+   
+   The listing declares one constant buffer, textureCount textures, a TEXCOORD input and the o0-o3 outputs, then fills lineCount lines with random arithmetic on 8 temp registers, using the instructions RipShader handles.
+   """
+   
+   rand = random.Random(seed)
+   lines = [
+      "// cbuffer CB0",
+      "// {",
+      "//",
+      "//   float4 g_Param0;                   // Offset:    0 Size:    16",
+      "//   float4 g_Param1;                   // Offset:   16 Size:    16",
+      "//   float4 g_Param2;                   // Offset:   32 Size:    16",
+      "//   float4 g_Param3;                   // Offset:   48 Size:    16",
+      "//",
+      "// }",
+      "//",
+      "// Resource Bindings:",
+      "//",
+      "// Name                                 Type  Format         Dim Slot Elements",
+      "// ------------------------------ ---------- ------- ----------- ---- --------",
+      "// g_Sampler                         sampler      NA          NA    0        1",
+   ]
+   for t in range(textureCount):
+      lines.append("// g_Texture{:<25} texture  float4          2d    {}        1".format(t, t))
+   lines += [
+      "// CB0                               cbuffer      NA          NA    0        1",
+      "//",
+      "//",
+      "// Input signature:",
+      "//",
+      "// Name                 Index   Mask Register SysValue  Format   Used",
+      "// -------------------- ----- ------ -------- -------- ------- ------",
+      "// SV_POSITION              0   xyzw        0      POS   float       ",
+      "// TEXCOORD                 0   xy          1     NONE   float   xy  ",
+      "//",
+      "//",
+      "// Output signature:",
+      "//",
+      "// Name                 Index   Mask Register SysValue  Format   Used",
+      "// -------------------- ----- ------ -------- -------- ------- ------",
+   ]
+   for o in range(4):
+      lines.append("// SV_Target                {}   xyzw        {}   TARGET   float   xyzw".format(o, o))
+   lines += [
+      "//",
+      "ps_5_0",
+      "dcl_globalFlags refactoringAllowed",
+      "dcl_constantbuffer cb0[4], immediateIndexed",
+      "dcl_sampler s0, mode_default",
+   ]
+   for t in range(textureCount):
+      lines.append("dcl_resource_texture2d (float,float,float,float) t{}".format(t))
+   lines += [
+      "dcl_input_ps linear v1.xy",
+      "dcl_output o0.xyzw",
+      "dcl_output o1.xyzw",
+      "dcl_output o2.xyzw",
+      "dcl_output o3.xyzw",
+      "dcl_temps 8",
+   ]
+   # Every temp register starts out with texture or constant buffer data, so every later read has something to connect to
+   for r in range(8):
+      if r < textureCount:
+         lines.append("sample_indexable(texture2d)(float,float,float,float) r{}.xyzw, v1.xyxx, t{}.xyzw, s0".format(r, r))
+      else:
+         lines.append("mov r{}.xyzw, cb0[{}].xyzw".format(r, r % 4))
+   
+   def reg(swizzleLength=4):
+      return "r{}.{}".format(rand.randrange(8), "".join(rand.choice("xyzw") for i in range(swizzleLength)))
+   
+   def literal():
+      return "l({:f}, {:f}, {:f}, {:f})".format(*[rand.uniform(-2.0, 2.0) for i in range(4)])
+   
+   def src():
+      choice = rand.random()
+      if choice < 0.1:
+         return literal()
+      if choice < 0.2:
+         return "cb0[{}].{}".format(rand.randrange(4), "".join(rand.choice("xyzw") for i in range(4)))
+      if choice < 0.25:
+         return "-" + reg()
+      if choice < 0.3:
+         return "|" + reg() + "|"
+      return reg()
+   
+   binary = ["add", "mul", "div", "max", "min", "lt", "ge", "ne"]
+   unary = ["mov", "frc", "rsq", "sqrt", "exp", "log", "round_ni", "round_z", "utof"]
+   while len(lines) < lineCount - 17:
+      dest = "r{}.{}".format(rand.randrange(8), "".join(sorted(rand.sample("xyzw", rand.randrange(1, 5)), key="xyzw".index)))
+      kind = rand.random()
+      if kind < 0.45:
+         op = rand.choice(binary) + ("_sat" if rand.random() < 0.1 else "")
+         lines.append("{} {}, {}, {}".format(op, dest, src(), src()))
+      elif kind < 0.7:
+         lines.append("{} {}, {}".format(rand.choice(unary), dest, src()))
+      elif kind < 0.8:
+         lines.append("mad {}, {}, {}, {}".format(dest, src(), src(), src()))
+      elif kind < 0.9:
+         lines.append("movc {}, {}, {}, {}".format(dest, src(), src(), src()))
+      elif kind < 0.95:
+         lines.append("dp{} r{}.{}, {}, {}".format(rand.choice([2, 3, 4]), rand.randrange(8), rand.choice("xyzw"), reg(), reg()))
+      else:
+         lines.append("and {}, {}, l(0x3f800000, 0x3f800000, 0x3f800000, 0x3f800000)".format(dest, reg()))
+   for o in range(4):
+      lines.append("mov o{}.xyzw, r{}.xyzw".format(o, o))
+   lines.append("ret")
+   lines.append("// Approximately {} instruction slots used".format(lineCount))
+   
+   with open(filePath, 'w') as file:
+      file.write("\n".join(lines) + "\n")
+
+def buildGraph(nodeCount, seed=0):
+   """Builds a synthetic RipNode graph without a shader file, for benchmarking the graph walks on their own
+   
+   Each Math node reads the node just before it and one random earlier node, so the graph has one dependency chain as long as the graph itself. The o0-o3 registers read the last nodes.
+   
+   Returns
+   -------
+   RipShader
+      a shader with only nodes and registers
+   """
+   
+   rand = random.Random(seed)
+   shader = RipShader("", "Graph_{}.ps".format(nodeCount), [])
+   shader.currentLine = 0
+   shader.nodes = []
+   outputs = [RipNode(shader, "Value").output()]
+   operations = ["ADD", "MULTIPLY", "MAXIMUM", "MINIMUM"]
+   for i in range(nodeCount - 1):
+      shader.currentLine = i + 1
+      node = RipNode(shader, "Math")
+      node.options['operation'] = rand.choice(operations)
+      node.input(0, outputs[-1])
+      node.input(1, outputs[rand.randrange(len(outputs))])
+      outputs.append(node.output())
+   shader.registers = {"o{}".format(o): {c: outputs[-1 - rand.randrange(min(16, len(outputs)))] for c in "xyzw"} for o in range(4)}
+   return shader
+
+def checkGraphWalk(nodeCount, seed=0):
+   """Checks RipShader.dependencyOrder on synthetic graphs from buildGraph, which the timing alone would not notice getting wrong
+   
+   Returns
+   -------
+   list[str]
+      what is wrong, or nothing if every node comes once and after all of its sources, and a graph with a cycle raises ValueError
+   """
+   
+   problems = []
+   shader = buildGraph(nodeCount, seed)
+   roots = shader.outputNodes()
+   order = shader.dependencyOrder(roots)
+   position = {}
+   for i in range(len(order)):
+      if order[i] in position:
+         problems.append("node {} comes more than once".format(i))
+      position[order[i]] = i
+   for root in roots:
+      if root not in position:
+         problems.append("a root node is missing")
+   for node in order:
+      for input in node.inputs.values():
+         if input.connection is not None and position.get(input.connection.node, len(order)) >= position[node]:
+            problems.append("a node comes before its source")
+            break
+   
+   # Turn the chain into a loop, by making the first Math node read the last node
+   cyclic = buildGraph(min(nodeCount, 100), seed)
+   cyclic.nodes[1].input(0).disconnect()
+   cyclic.nodes[1].input(0, cyclic.nodes[-1].output())
+   try:
+      cyclic.dependencyOrder(cyclic.outputNodes())
+      problems.append("a cycle was not detected")
+   except ValueError:
+      pass
+   return problems
+
+def measure(function, repeat):
+   """Runs function repeat times for the best wall time, then once more under tracemalloc for the peak memory
+   
+   Returns
+   -------
+   dict
+      'seconds': the fastest run, 'peakMemory': the most memory allocated at once, in bytes
+   """
+   
+   best = None
+   with contextlib.redirect_stdout(io.StringIO()):
+      for i in range(repeat):
+         start = time.perf_counter()
+         function()
+         elapsed = time.perf_counter() - start
+         best = elapsed if best is None else min(best, elapsed)
+      tracemalloc.start()
+      try:
+         function()
+         peak = tracemalloc.get_traced_memory()[1]
+      finally:
+         tracemalloc.stop()
+   return {'seconds': best, 'peakMemory': peak}
+
+def run(workDir, vertexCounts, shaderLines, semantics, textureCount=4, repeat=3, graphNodes=()):
+   """Generates a synthetic capture in workDir and benchmarks RipFile and RipShader on it
+   
+   Returns
+   -------
+   dict
+      a result dict per case name, each with 'seconds' and 'peakMemory', plus the throughput metrics that apply to it
+   """
+   
+   ripDir = os.path.join(workDir, "Rips")
+   shaderDir = os.path.join(workDir, "Shaders")
+   os.makedirs(ripDir, exist_ok=True)
+   os.makedirs(shaderDir, exist_ok=True)
+   textures = ["Tex_{:04}_0.dds".format(t) for t in range(textureCount)]
+   results = {}
+   
+   for vertexCount in vertexCounts:
+      faceCount = vertexCount * 3 // 2
+      filePath = os.path.join(ripDir, "Mesh_{}.rip".format(vertexCount))
+      if not os.path.isfile(filePath):
+         writeRip(filePath, vertexCount, faceCount, semantics, textures, ["Shader_{}.vs".format(vertexCount), "Shader_{}.ps".format(vertexCount)], seed=vertexCount)
+      fileSize = os.path.getsize(filePath)
+      cases = {
+         'scan': lambda: RipFile(filePath).scan(),
+         'parse': lambda: RipFile(filePath).parse(),
+         'parse-mmap': lambda: RipFile(filePath).parse(memoryMap=True),
+         'parse-streaming': lambda: RipFile(filePath).parse(streaming=True),
+      }
+      for case in cases:
+         result = measure(cases[case], repeat)
+         if case != 'scan':
+            result['MB/s'] = fileSize / 1048576 / result['seconds']
+            result['vertices/s'] = vertexCount / result['seconds']
+         results["{}/{}".format(case, vertexCount)] = result
+   
+   for lineCount in shaderLines:
+      fileName = "Shader_{}.ps".format(lineCount)
+      if not os.path.isfile(os.path.join(shaderDir, fileName)):
+         writeShader(os.path.join(shaderDir, fileName), lineCount, textureCount, seed=lineCount)
+      textureData = [{'fileName': t, 'filePath': os.path.join(ripDir, t)} for t in textures]
+      result = measure(lambda: RipShader(shaderDir, fileName, textureData).parse(), repeat)
+      result['lines/s'] = lineCount / result['seconds']
+      results["shader/{}".format(lineCount)] = result
+   
+   for nodeCount in graphNodes:
+      problems = checkGraphWalk(nodeCount, seed=nodeCount)
+      if len(problems) > 0:
+         raise RuntimeError("graph walk of {} nodes is wrong: {}".format(nodeCount, "; ".join(problems[:5])))
+      shader = buildGraph(nodeCount, seed=nodeCount)
+      result = measure(lambda: shader.dependencyOrder(shader.outputNodes()), repeat)
+      result['nodes/s'] = nodeCount / result['seconds']
+      results["graph-walk/{}".format(nodeCount)] = result
+   
+   return results
+
+def compare(results, baseline, tolerance):
+   """Finds the cases that got slower than the baseline by more than tolerance (0.2 = 20%)
+   
+   Returns
+   -------
+   list
+      (case, baseline seconds, new seconds) for each regression
+   """
+   
+   regressions = []
+   for case in results:
+      if case in baseline and results[case]['seconds'] > baseline[case]['seconds'] * (1 + tolerance):
+         regressions.append((case, baseline[case]['seconds'], results[case]['seconds']))
+   return regressions
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Benchmark RIP file and shader parsing on a synthetic capture.")
+   parser.add_argument("--vertices", default="1000,10000,100000,1000000", help="comma-separated vertex counts, one RIP file each (faces are 1.5x vertices)")
+   parser.add_argument("--shader-lines", default="500,5000", help="comma-separated line counts, one pixel shader each")
+   parser.add_argument("--graph-nodes", default="100000", help="comma-separated node counts, one synthetic node graph each")
+   parser.add_argument("--semantics", default=defaultSemantics, help="vertex layout, e.g. POSITION:3f,NORMAL:4f,BLENDINDICES:4u (f=FLOAT, u=UINT, s=SINT)")
+   parser.add_argument("--textures", type=int, default=4, help="how many textures each file lists")
+   parser.add_argument("--repeat", type=int, default=3, help="runs per case, the fastest one counts")
+   parser.add_argument("--work-dir", default=None, help="where to generate the capture (default: a temporary directory); files already there are reused")
+   parser.add_argument("--baseline", default=None, help="JSON file from --save to compare against")
+   parser.add_argument("--tolerance", type=float, default=0.2, help="how much slower than the baseline counts as a regression")
+   parser.add_argument("--save", default=None, help="write the results to this JSON file")
+   args = parser.parse_args(argv)
+   
+   vertexCounts = [int(v) for v in args.vertices.split(",") if v]
+   shaderLines = [int(v) for v in args.shader_lines.split(",") if v]
+   graphNodes = [int(v) for v in args.graph_nodes.split(",") if v]
+   semantics = parseSemantics(args.semantics)
+   if args.work_dir is None:
+      with tempfile.TemporaryDirectory() as workDir:
+         results = run(workDir, vertexCounts, shaderLines, semantics, args.textures, args.repeat, graphNodes)
+   else:
+      results = run(args.work_dir, vertexCounts, shaderLines, semantics, args.textures, args.repeat, graphNodes)
+   
+   print("{:<28} {:>10} {:>12} {:>10} {:>14}".format("case", "seconds", "peak MB", "MB/s", "items/s"))
+   for case in results:
+      result = results[case]
+      rate = result.get('vertices/s', result.get('lines/s', result.get('nodes/s')))
+      print("{:<28} {:>10.4f} {:>12.1f} {:>10} {:>14}".format(case, result['seconds'], result['peakMemory'] / 1048576, "{:.1f}".format(result['MB/s']) if 'MB/s' in result else "-", "{:.0f}".format(rate) if rate is not None else "-"))
+   
+   if args.save is not None:
+      with open(args.save, 'w') as file:
+         json.dump(results, file, indent=2)
+   if args.baseline is not None:
+      with open(args.baseline) as file:
+         regressions = compare(results, json.load(file), args.tolerance)
+      for case, before, after in regressions:
+         print("REGRESSION {}: {:.4f}s -> {:.4f}s".format(case, before, after))
+      if len(regressions) > 0:
+         return 1
+   return 0
+
+if __name__ == "__main__":
+   sys.exit(main())
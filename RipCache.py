@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import hashlib
+import zipfile
+import numpy
+
+def userCacheDir():
+   """Gets the folder the cache goes in by default, which belongs to the current user, unlike a folder in the shared temporary directory that another user could create first
+   
+   Returns
+   -------
+   str
+      a folder in %LOCALAPPDATA% on Windows, ~/Library/Caches on macOS, or $XDG_CACHE_HOME (~/.cache) elsewhere
+   """
+   
+   if os.name == "nt":
+      base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+   elif sys.platform == "darwin":
+      base = os.path.join(os.path.expanduser("~"), "Library", "Caches")
+   else:
+      base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+   return os.path.join(base, "ninjaripper-import")
+
+class RipCache:
+   """On-disk cache of parsed RIP files, so re-importing the same capture doesn't decode every file again
+   
+   Each entry is an uncompressed .npz file holding the arrays of RipFile.parsedState, plus the rest of the state as JSON. Entries are keyed on the file path, size and modification time and on the parse options that change the decoded data. The least recently used entries are deleted once the cache grows past maxSize.
+   """
+   
+   formatVersion = 5
+   keyOptions = ['xyzOrder', 'uvOrder', 'scale']
+   defaultDir = userCacheDir()
+   
+   def __init__(self, cacheDir=None, maxSize=2*1024**3):
+      self.cacheDir = cacheDir if cacheDir is not None else self.defaultDir
+      self.maxSize = maxSize
+      self.hits = 0
+      self.misses = 0
+      try:
+         os.makedirs(self.cacheDir, exist_ok=True)
+      except OSError as e:
+         print("Could not create the parse cache folder {} ({})".format(self.cacheDir, e))
+   
+   def entryPath(self, ripFile, options):
+      """Gets the path of the cache entry for the given file and parse options
+      
+      Returns
+      -------
+      str
+         the .npz file path, which changes whenever the RIP file or the relevant options do
+      """
+      
+      stat = os.stat(ripFile.filePath)
+      key = [self.formatVersion, os.path.normcase(os.path.abspath(ripFile.filePath)), stat.st_size, stat.st_mtime_ns]
+      key += [options.get(option) for option in self.keyOptions]
+      return os.path.join(self.cacheDir, hashlib.sha1(repr(key).encode()).hexdigest() + ".npz")
+   
+   def load(self, ripFile, options):
+      """Loads a cached parse result into ripFile with RipFile.loadParsedState
+      
+      Returns
+      -------
+      bool
+         True if the file was in the cache, False if it still needs to be parsed
+      """
+      
+      path = self.entryPath(ripFile, options)
+      if not os.path.isfile(path):
+         self.misses += 1
+         return False
+      try:
+         with numpy.load(path, allow_pickle=False) as entry:
+            state = json.loads(str(entry['__state__']))
+            state['arrays'] = {name: entry[name] for name in entry.files if name != '__state__'}
+      except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+         print("{}: discarding unreadable cache entry ({})".format(ripFile.fileLabel, e))
+         try:
+            os.remove(path)
+         except OSError:
+            pass
+         self.misses += 1
+         return False
+      ripFile.loadParsedState(state)
+      # The modification time of an entry doubles as its last use, for evict()
+      try:
+         os.utime(path)
+      except OSError:
+         pass
+      self.hits += 1
+      return True
+   
+   def store(self, ripFile, options):
+      """Saves the parse result of ripFile to the cache, or prints why it couldn't
+      """
+      
+      path = self.entryPath(ripFile, options)
+      state = ripFile.parsedState()
+      arrays = state.pop('arrays')
+      tempPath = path + ".tmp"
+      # The cache is only a shortcut, so a full disk or a read-only cache folder shouldn't stop the import
+      try:
+         with open(tempPath, 'wb') as file:
+            numpy.savez(file, __state__=numpy.array(json.dumps(state)), **arrays)
+         os.replace(tempPath, path)
+      except OSError as e:
+         print("{}: could not write the cache entry {} ({})".format(ripFile.fileLabel, path, e))
+         try:
+            os.remove(tempPath)
+         except OSError:
+            pass
+   
+   def evict(self):
+      """Deletes the least recently used entries until the cache fits in maxSize
+      
+      Returns
+      -------
+      int
+         how many entries were deleted
+      """
+      
+      if not os.path.isdir(self.cacheDir):
+         return 0
+      entries = []
+      total = 0
+      # Like store(), none of this is allowed to stop the import, so entries that can't be looked at or deleted are just left alone
+      try:
+         names = os.listdir(self.cacheDir)
+      except OSError as e:
+         print("Could not read the parse cache folder {} ({})".format(self.cacheDir, e))
+         return 0
+      for name in names:
+         if name.endswith(".npz"):
+            try:
+               stat = os.stat(os.path.join(self.cacheDir, name))
+            except OSError:
+               continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+      entries.sort()
+      removed = 0
+      for mtime, size, name in entries:
+         if total <= self.maxSize:
+            break
+         try:
+            os.remove(os.path.join(self.cacheDir, name))
+         except OSError as e:
+            print("Could not delete the cache entry {} ({})".format(name, e))
+            continue
+         total -= size
+         removed += 1
+      return removed
@@ -1,21 +1,37 @@
 import os
-import time
+import mmap
 import struct
+import hashlib
+import numpy
 from functools import reduce
 
-# Needed for stand-alone tests
-import importlib
-if importlib.find_loader("bpy") is not None:
+# Needed for stand-alone tests and for RipPool worker processes, which import these modules outside of the add-on package
+if __package__:
    from .RipShader import RipShader
+   from . import RipProfile
 else:
    from RipShader import RipShader
+   import RipProfile
 
 class RipFile:
    typeLookup = ["FLOAT", "UINT", "SINT"]
    typePackLookup = ["f", "L", "l"]
+   typeDtypeLookup = ["<f4", "<u4", "<i4"]
+   # character: (source component, factor, offset)
+   xyzLookup = {'x': (0, 1, 0), 'y': (1, 1, 0), 'z': (2, 1, 0), 'X': (0, -1, 0), 'Y': (1, -1, 0), 'Z': (2, -1, 0)}
+   scanBlockSize = 4096
+   # Files with at least this many vertices are parsed with streaming=True by the importer
+   streamingVertexCount = 4000000
+   streamChunkSize = 262144
+   headerFields = ['faceCount', 'vertexCount', 'vertexSize', 'textureCount', 'shaderCount', 'semanticCount', 'semantics', 'textures', 'shaderNames', 'dataOffset', 'is3D']
+   uvLookup = {'u': (0, 1, 0), 'v': (1, 1, 0), 'U': (0, -1, 0), 'V': (1, -1, 0), 'o': (0, 1, 1), 'w': (1, 1, 1), 'O': (0, -1, 1), 'W': (1, -1, 1)}
    
-   def __init__(self, filePath: str):
+   def __init__(self, filePath: str, shaderRegistry=None):
+      self.scanned = False
+      # Optional RipShaderRegistry, to share parsed shaders with other RipFiles
+      self.shaderRegistry = shaderRegistry
       self.parsed = False
+      self.streaming = False
       if not os.path.isfile(filePath):
          raise ValueError("String '{}' passed to RipFile(str) is not a valid file path.".format(filePath))
       self.filePath = os.path.normpath(filePath)
@@ -27,159 +43,408 @@ class RipFile:
       if not os.path.isdir(self.shaderDir):
          self.shaderDir = None
    
-   def parse(self, xyzOrder="xzy", uvOrder="uW", scale=1.0, keep2D=False, keepUntextured=False):
-      parseStart = time.process_time()
-      with open(self.filePath, 'rb') as self.file:
-         signature, version = self.__read('LL', 8)
-         if signature != 3735929054:
-            print("Invalid RIP signature. Continuing anyway, but this might not work...")
-         if version != 4:
-            print("Invalid RIP version. Expected {}, found {}. Continuing anyway, but this might not work...".format(4, version))
-         
-         self.faceCount, self.vertexCount, self.vertexSize, self.textureCount, self.shaderCount, self.semanticCount = self.__read('LLLLLL', 24)
-         
-         is3D = False
-         self.semantics = []
-         for i in range(self.semanticCount):
-            semanticData = {'name': self.__readString()}
-            semanticData['nameUpper'] = semanticData['name'].upper()
-            semanticData['index'], semanticData['offset'], semanticData['size'], semanticData['typeCount'] = self.__read('LLLL', 16)
-            semanticData['label'] = "{}{}".format(semanticData['name'], semanticData['index'])
-            semanticData['types'] = []
-            for k in range(semanticData['typeCount']):
-               semanticData['types'].append(self.__read('L', 4)[0])
-            self.semantics.append(semanticData)
-            if semanticData['nameUpper'] == "POSITION" and semanticData['typeCount'] == 3:
-               is3D = True
-         
-         if not is3D and not keep2D:
-            print("{}: skipping because not 3D".format(self.fileLabel))
-            return False
-         
-         self.textures = []
-         for i in range(self.textureCount):
-            texture = {'fileName': self.__readString()}
-            texture['filePath'] = os.path.join(self.fileDir, texture['fileName'])
-            self.textures.append(texture)
-         
-         if len(self.textures) == 0 and not keepUntextured:
-            print("{}: skipping because untextured".format(self.fileLabel))
-            return False
-         
-         self.shaders = []
-         for i in range(self.shaderCount):
-            self.shaders.append(RipShader(self.shaderDir, self.__readString(), self.textures))
-         
-         self.faces = []
-         for i in range(self.faceCount):
-            self.faces.append(self.__read('LLL', 12))
-         
+   def scan(self):
+      """Reads only the header, semantic table, texture table and shader table of the file
+      
+      This is enough to decide whether a file will be skipped (see skipReason) without decoding any of its faces or vertices. The tables are read in blocks rather than value by value.
+      """
+      
+      with RipProfile.span("header decode", self.fileLabel):
+         with open(self.filePath, 'rb') as self.file:
+            self.buffer = self.file.read(self.scanBlockSize)
+            self.position = 0
+            signature, version = self.__read('LL', 8)
+            if signature != 3735929054:
+               print("Invalid RIP signature. Continuing anyway, but this might not work...")
+            if version != 4:
+               print("Invalid RIP version. Expected {}, found {}. Continuing anyway, but this might not work...".format(4, version))
+            
+            self.faceCount, self.vertexCount, self.vertexSize, self.textureCount, self.shaderCount, self.semanticCount = self.__read('LLLLLL', 24)
+            
+            self.is3D = False
+            self.semantics = []
+            for i in range(self.semanticCount):
+               semanticData = {'name': self.__readString()}
+               semanticData['nameUpper'] = semanticData['name'].upper()
+               semanticData['index'], semanticData['offset'], semanticData['size'], semanticData['typeCount'] = self.__read('LLLL', 16)
+               semanticData['label'] = "{}{}".format(semanticData['name'], semanticData['index'])
+               semanticData['types'] = list(self.__read('L' * semanticData['typeCount'], 4 * semanticData['typeCount']))
+               self.semantics.append(semanticData)
+               if semanticData['nameUpper'] == "POSITION" and semanticData['typeCount'] == 3:
+                  self.is3D = True
+            
+            # Texture and shader names are only decoded once something asks for them, which never happens for skipped files.
+            self.textures = RipTextureList(self.__readStringTable(self.textureCount), self.fileDir)
+            self.shaderNames = self.__readStringTable(self.shaderCount)
+            
+            self.dataOffset = self.position
+            self.buffer = None
+         RipProfile.count("header bytes", self.dataOffset, self.fileLabel)
+      self.scanned = True
+      return True
+   
+   def skipReason(self, keep2D=False, keepUntextured=False):
+      """Decides from the scanned header whether this file should be skipped
+      
+      Returns
+      -------
+      str or None
+         why the file should be skipped, or None if it should be imported
+      """
+      
+      if not self.scanned:
+         self.scan()
+      if not self.is3D and not keep2D:
+         return "not 3D"
+      if len(self.textures) == 0 and not keepUntextured:
+         return "untextured"
+      return None
+   
+   def materialSignature(self, importShaders=False):
+      """Identifies the material RipMesh would build for this file, so meshes that would get the same material can share one
+      
+      Parameters
+      ----------
+      importShaders : bool
+         whether the material is built from the pixel shader instead of just holding the textures
+      
+      Returns
+      -------
+      tuple or None
+         the normalized texture paths, the pixel shader path (None unless importShaders) and importShaders, or None if the file has no textures and so gets no material. The textures are sorted unless importShaders, because a shader refers to its textures by their position in the list.
+      """
+      
+      if not self.scanned:
+         self.scan()
+      if len(self.textures) == 0:
+         return None
+      textures = [os.path.normcase(os.path.normpath(texture['filePath'])) for texture in self.textures]
+      pixelShader = None
+      if importShaders:
+         for shaderName in self.shaderNames:
+            if shaderName.upper().endswith(".PS") and self.shaderDir is not None:
+               pixelShader = os.path.normcase(os.path.normpath(os.path.join(self.shaderDir, shaderName)))
+      else:
+         textures.sort()
+      return (tuple(textures), pixelShader, importShaders)
+   
+   def parse(self, xyzOrder="xzy", uvOrder="uW", scale=1.0, keep2D=False, keepUntextured=False, memoryMap=False, streaming=False):
+      """Reads the faces and vertices of the file
+      
+      Parameters
+      ----------
+      streaming : bool
+         if True, the faces and vertices are only read once here to find the bounds and fingerprint, and are not kept in memory. Use faceChunks() and vertexChunks() to read them again a piece at a time.
+      """
+      
+      reason = self.skipReason(keep2D, keepUntextured)
+      if reason is not None:
+         print("{}: skipping because {}".format(self.fileLabel, reason))
+         return False
+      
+      with RipProfile.span("vertex decode", self.fileLabel, streaming=streaming, memoryMap=memoryMap):
+         self.parseOptions = {'xyzOrder': xyzOrder, 'uvOrder': uvOrder, 'scale': scale}
+         self.streaming = streaming
+         self.__createShaders()
          self.pMax = []
          self.pMin = []
-         self.vertexes = []
-         for i in range(self.vertexCount):
-            vertex = {'index': i}
-            for semantic in self.semantics:
-               format = ""
-               for t in semantic['types']:
-                  format += self.typePackLookup[t]
-               data = self.__read(format, semantic['size'])
-               if semantic['nameUpper'] == "POSITION":
-                  if len(self.pMax) == 0:
-                     for d in data:
-                        self.pMax.append(d)
-                  if len(self.pMin) == 0:
-                     for d in data:
-                        self.pMin.append(d)
-                  for i in range(len(data)):
-                     if data[i] > self.pMax[i]:
-                        self.pMax[i] = data[i]
-                     if data[i] < self.pMin[i]:
-                        self.pMin[i] = data[i]
-               # TODO: I would prefer if scaling and ordering was done in RipMesh, so that the parsed data is authentic to the saved file
-               if semantic['nameUpper'] == "POSITION" or semantic['nameUpper'] == "NORMAL":
-                  vertex[semantic['label']] = []
-                  for i in xyzOrder:
-                     if i == "x":
-                        vertex[semantic['label']].append((data[0] if len(data) > 0 else 0) * scale)
-                     elif i == "y":
-                        vertex[semantic['label']].append((data[1] if len(data) > 1 else 0) * scale)
-                     elif i == "z":
-                        vertex[semantic['label']].append((data[2] if len(data) > 2 else 0) * scale)
-                     elif i == "X":
-                        vertex[semantic['label']].append((data[0] if len(data) > 0 else 0) * -1 * scale)
-                     elif i == "Y":
-                        vertex[semantic['label']].append((data[1] if len(data) > 1 else 0) * -1 * scale)
-                     elif i == "Z":
-                        vertex[semantic['label']].append((data[2] if len(data) > 2 else 0) * -1 * scale)
-                     else:
-                        raise ValueError("xyzOrder parameter ({}) has invalid character ({})".format(xyzOrder, i))
-               elif semantic['nameUpper'] == "TEXCOORD":
-                  vertex[semantic['label']] = []
-                  for i in uvOrder:
-                     if i == "u":
-                        vertex[semantic['label']].append((data[0] if len(data) > 0 else 0))
-                     elif i == "v":
-                        vertex[semantic['label']].append((data[1] if len(data) > 1 else 0))
-                     elif i == "U":
-                        vertex[semantic['label']].append((data[0] if len(data) > 0 else 0) * -1)
-                     elif i == "V":
-                        vertex[semantic['label']].append((data[1] if len(data) > 1 else 0) * -1)
-                     elif i == "o":
-                        vertex[semantic['label']].append((data[0] if len(data) > 0 else 0) + 1)
-                     elif i == "w":
-                        vertex[semantic['label']].append((data[1] if len(data) > 1 else 0) + 1)
-                     elif i == "O":
-                        vertex[semantic['label']].append((data[0] if len(data) > 0 else 0) * -1 + 1)
-                     elif i == "W":
-                        vertex[semantic['label']].append((data[1] if len(data) > 1 else 0) * -1 + 1)
-                     else:
-                        raise ValueError("uvOrder parameter ({}) has invalid character ({})".format(uvOrder, i))
+         # Identifies duplicate meshes: the raw position and index buffers, which stay the same no matter which textures a duplicate was drawn with
+         contentHash = hashlib.blake2b(digest_size=16)
+         # Identifies meshes that can share one Blender mesh: the index buffer and the whole vertex buffer, laid out the same way
+         geometryHash = hashlib.blake2b(digest_size=16)
+         geometryHash.update(repr([self.vertexSize] + [(s['nameUpper'], s['index'], s['offset'], s['types']) for s in self.semantics]).encode())
+         self.invalidFaceCount = 0
+         if streaming:
+            for faces in self.faceChunks():
+               contentHash.update(faces.tobytes())
+               geometryHash.update(faces)
+               self.invalidFaceCount += len(faces) - int(self.faceMask(faces).sum())
+            for start, vertexBlock in self.__vertexBlocks(self.streamChunkSize):
+               self.__measure(vertexBlock, contentHash)
+               geometryHash.update(vertexBlock)
+            self.faces = None
+            self.vertexData = None
+            self.vertexes = None
+         else:
+            with open(self.filePath, 'rb') as self.file:
+               # When memory-mapped, the face and vertex arrays are views straight into the mapped file, which stays open for as long as they do.
+               if memoryMap:
+                  self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
                else:
-                  vertex[semantic['label']] = data
-            self.vertexes.append(vertex)
-         
-         parseTime = time.process_time() - parseStart
-         print("{}: parse took {}s".format(self.fileLabel, parseTime))
-         self.parsed = True
+                  self.buffer = None
+                  self.file.seek(self.dataOffset)
+               self.position = self.dataOffset
+               self.faces = self.__readArray(numpy.dtype('<u4'), self.faceCount * 3).reshape(-1, 3)
+               vertexBlock = self.__readArray(self.vertexDtype(), self.vertexCount)
+               self.buffer = None
+            contentHash.update(self.faces.tobytes())
+            geometryHash.update(self.faces)
+            self.invalidFaceCount = len(self.faces) - int(self.faceMask(self.faces).sum())
+            self.__measure(vertexBlock, contentHash)
+            geometryHash.update(vertexBlock)
+            # Without a memory map, every column is copied out of the block, so the block itself can be dropped after this.
+            self.vertexData = self.__decodeVertices(vertexBlock, not memoryMap)
+            self.vertexes = RipVertexList(self.vertexData, self.vertexCount)
+         self.fingerprint = (self.faceCount, self.vertexCount, contentHash.hexdigest())
+         self.geometryKey = (self.faceCount, self.vertexCount, geometryHash.hexdigest())
+         if self.invalidFaceCount > 0:
+            print("{}: {} of {} faces use a vertex twice or a vertex past the {} in the file, they will be left out".format(self.fileLabel, self.invalidFaceCount, self.faceCount, self.vertexCount))
+         RipProfile.count("bytes read", self.faceCount * 12 + self.vertexCount * self.vertexSize, self.fileLabel)
+      self.__countParsed()
+      self.parsed = True
       return True
    
+   def faceChunks(self, chunkSize=None):
+      """Reads the faces of the file a piece at a time, for files parsed with streaming=True
+      
+      Parameters
+      ----------
+      chunkSize : int or None
+         the most faces to read at once, or None for streamChunkSize
+      
+      Yields
+      ------
+      numpy.ndarray
+         a (count, 3) uint32 array of vertex indices
+      """
+      
+      chunkSize = chunkSize or self.streamChunkSize
+      with open(self.filePath, 'rb') as file:
+         file.seek(self.dataOffset)
+         for start in range(0, self.faceCount, chunkSize):
+            count = min(chunkSize, self.faceCount - start)
+            yield numpy.frombuffer(file.read(count * 12), dtype='<u4', count=count * 3).reshape(-1, 3)
+   
+   def faceMask(self, faces):
+      """Checks which faces Blender will be able to use
+      
+      Parameters
+      ----------
+      faces : numpy.ndarray
+         a (count, 3) array of vertex indices, like self.faces or a chunk from faceChunks()
+      
+      Returns
+      -------
+      numpy.ndarray
+         a bool array, False for each face that uses the same vertex twice or refers to a vertex index past vertexCount
+      """
+      
+      return (faces[:,0] != faces[:,1]) & (faces[:,1] != faces[:,2]) & (faces[:,0] != faces[:,2]) & (faces < self.vertexCount).all(axis=1)
+   
+   def vertexChunks(self, chunkSize=None):
+      """Reads and decodes the vertices of the file a piece at a time, for files parsed with streaming=True
+      
+      Parameters
+      ----------
+      chunkSize : int or None
+         the most vertices to read at once, or None for streamChunkSize
+      
+      Yields
+      ------
+      tuple
+         the index of the first vertex in the chunk, and a dict like self.vertexData for just the vertices in the chunk
+      """
+      
+      for start, vertexBlock in self.__vertexBlocks(chunkSize or self.streamChunkSize):
+         yield start, self.__decodeVertices(vertexBlock, True)
+   
+   def __vertexBlocks(self, chunkSize):
+      dtype = self.vertexDtype()
+      with open(self.filePath, 'rb') as file:
+         file.seek(self.dataOffset + self.faceCount * 12)
+         for start in range(0, self.vertexCount, chunkSize):
+            count = min(chunkSize, self.vertexCount - start)
+            yield start, numpy.frombuffer(file.read(count * self.vertexSize), dtype=dtype, count=count)
+   
+   def __measure(self, vertexBlock, contentHash):
+      # Updates the position bounds and the fingerprint hash with a block of raw vertices
+      hashed = False
+      for s in range(len(self.semantics)):
+         if self.semantics[s]['nameUpper'] == "POSITION":
+            data = self.__semanticColumn(vertexBlock, s)
+            if not hashed:
+               contentHash.update(numpy.ascontiguousarray(data).tobytes())
+               hashed = True
+            if len(data) > 0:
+               dataMax = data.max(axis=0).tolist()
+               dataMin = data.min(axis=0).tolist()
+               if len(self.pMax) == 0:
+                  self.pMax = dataMax
+                  self.pMin = dataMin
+               else:
+                  self.pMax = [max(a, b) for a, b in zip(self.pMax, dataMax)]
+                  self.pMin = [min(a, b) for a, b in zip(self.pMin, dataMin)]
+   
+   def __decodeVertices(self, vertexBlock, contiguous):
+      vertexData = {}
+      for s in range(len(self.semantics)):
+         semantic = self.semantics[s]
+         data = self.__semanticColumn(vertexBlock, s)
+         # TODO: I would prefer if scaling and ordering was done in RipMesh, so that the parsed data is authentic to the saved file
+         if semantic['nameUpper'] == "POSITION" or semantic['nameUpper'] == "NORMAL":
+            data = self.__remap(data, self.parseOptions['xyzOrder'], self.xyzLookup, self.parseOptions['scale'], "xyzOrder")
+         elif semantic['nameUpper'] == "TEXCOORD":
+            data = self.__remap(data, self.parseOptions['uvOrder'], self.uvLookup, 1.0, "uvOrder")
+         elif contiguous:
+            data = numpy.ascontiguousarray(data)
+         vertexData[semantic['label']] = data
+      return vertexData
+   
+   def parsedState(self):
+      """Gets everything parse() decoded, in a form that can be pickled or saved and later given to loadParsedState()
+      
+      Returns
+      -------
+      dict
+         'header': the values read by scan(), 'pMax'/'pMin': the position bounds, 'fingerprint', 'geometryKey' and 'invalidFaceCount': see parse(), 'parseOptions': the options that affect the decoded data, 'arrays': a flat dict of NumPy arrays ('faces', and 'vertex.' + the label of each semantic)
+      """
+      
+      arrays = {'faces': self.faces}
+      for label in self.vertexData:
+         arrays['vertex.' + label] = self.vertexData[label]
+      header = {field: getattr(self, field) for field in self.headerFields}
+      header['textures'] = list(self.textures)
+      header['shaderNames'] = list(self.shaderNames)
+      return {
+         'header': header,
+         'pMax': self.pMax,
+         'pMin': self.pMin,
+         'fingerprint': self.fingerprint,
+         'geometryKey': self.geometryKey,
+         'invalidFaceCount': self.invalidFaceCount,
+         'parseOptions': self.parseOptions,
+         'arrays': arrays,
+      }
+   
+   def loadParsedState(self, state):
+      """Restores the result of parse() from a dict made by parsedState(), without reading the file
+      """
+      
+      for field in self.headerFields:
+         setattr(self, field, state['header'][field])
+      self.scanned = True
+      self.pMax = state['pMax']
+      self.pMin = state['pMin']
+      self.fingerprint = tuple(state['fingerprint'])
+      self.geometryKey = tuple(state['geometryKey'])
+      self.invalidFaceCount = state['invalidFaceCount']
+      self.parseOptions = state['parseOptions']
+      self.streaming = False
+      self.faces = state['arrays']['faces']
+      self.vertexData = {}
+      for semantic in self.semantics:
+         self.vertexData[semantic['label']] = state['arrays']['vertex.' + semantic['label']]
+      self.__createShaders()
+      self.vertexes = RipVertexList(self.vertexData, self.vertexCount)
+      self.__countParsed()
+      self.parsed = True
+   
+   def __countParsed(self):
+      RipProfile.count("vertices", self.vertexCount, self.fileLabel)
+      RipProfile.count("faces", self.faceCount, self.fileLabel)
+   
+   def __createShaders(self):
+      self.shaders = []
+      for shaderName in self.shaderNames:
+         if self.shaderRegistry is not None:
+            self.shaders.append(self.shaderRegistry.get(self.shaderDir, shaderName, self.textures))
+         else:
+            self.shaders.append(RipShader(self.shaderDir, shaderName, self.textures))
+   
+   def vertexDtype(self):
+      """Builds a structured NumPy dtype describing one vertex of this file
+      
+      Returns
+      -------
+      numpy.dtype
+         one field per semantic (named 's0', 's1', ...) at the semantic's offset, or one field per component (named 's0_0', 's0_1', ...) if the semantic mixes component types
+      """
+      
+      names = []
+      formats = []
+      offsets = []
+      for s in range(len(self.semantics)):
+         semantic = self.semantics[s]
+         types = semantic['types']
+         if len(types) > 0 and types.count(types[0]) == len(types):
+            names.append("s{}".format(s))
+            formats.append((self.typeDtypeLookup[types[0]], (len(types),)))
+            offsets.append(semantic['offset'])
+         else:
+            for k in range(len(types)):
+               names.append("s{}_{}".format(s, k))
+               formats.append(self.typeDtypeLookup[types[k]])
+               offsets.append(semantic['offset'] + 4*k)
+      return numpy.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': self.vertexSize})
+   
+   def __semanticColumn(self, vertexBlock, s):
+      types = self.semantics[s]['types']
+      if len(types) > 0 and types.count(types[0]) == len(types):
+         return vertexBlock["s{}".format(s)]
+      elif len(types) > 0:
+         return numpy.column_stack([vertexBlock["s{}_{}".format(s, k)] for k in range(len(types))])
+      else:
+         return numpy.zeros((len(vertexBlock), 0), dtype=numpy.float32)
+   
+   def __remap(self, data, order, lookup, scale, parameter):
+      result = numpy.zeros((len(data), len(order)), dtype=numpy.float32)
+      for c in range(len(order)):
+         if order[c] not in lookup:
+            raise ValueError("{} parameter ({}) has invalid character ({})".format(parameter, order, order[c]))
+         component, factor, offset = lookup[order[c]]
+         if component < data.shape[1]:
+            result[:, c] = data[:, component] * (factor * scale)
+         if offset != 0:
+            result[:, c] += offset
+      return result
+   
    def __read(self, format, size):
-      return struct.unpack(format, self.file.read(size))
+      if type(self.buffer) is bytes and self.position + size > len(self.buffer):
+         self.buffer += self.file.read(max(size, self.scanBlockSize))
+      if self.buffer is not None:
+         data = struct.unpack_from('<' + format, self.buffer, self.position)
+         self.position += size
+         return data
+      return struct.unpack('<' + format, self.file.read(size))
+   
+   def __readArray(self, dtype, count):
+      size = dtype.itemsize * count
+      if self.buffer is not None:
+         data = numpy.frombuffer(self.buffer, dtype=dtype, count=count, offset=self.position)
+         self.position += size
+         return data
+      return numpy.frombuffer(self.file.read(size), dtype=dtype, count=count)
+   
+   def __findNul(self, start):
+      end = self.buffer.find(b"\0", start)
+      while end == -1:
+         more = self.file.read(self.scanBlockSize)
+         if len(more) == 0:
+            raise ValueError("Unterminated string at offset {} of '{}'".format(start, self.filePath))
+         self.buffer += more
+         end = self.buffer.find(b"\0", start)
+      return end
    
    def __readString(self) -> str:
-      result = ""
-      done = False
-      while not done:
-         val = self.__read('B', 1)[0]
-         if val == 0:
-            done = True
-         else:
-            result += chr(val)
+      end = self.__findNul(self.position)
+      result = RipStringTable.decode(self.buffer[self.position:end])
+      self.position = end + 1
       return result
    
+   def __readStringTable(self, count):
+      start = self.position
+      ends = []
+      for i in range(count):
+         ends.append(self.__findNul(self.position) - start)
+         self.position = start + ends[-1] + 1
+      return RipStringTable(self.buffer[start:self.position], ends)
+   
    def seemsEqual(self, other):
       if not isinstance(other, RipFile):
          return False
       if not self.parsed or not other.parsed:
          return False
-      if len(self.faces) != len(other.faces):
-         return False
-      if len(self.vertexes) != len(other.vertexes):
-         return False
-      if len(self.pMax) != len(other.pMax):
-         return False
-      else:
-         for i in range(len(self.pMax)):
-            if self.pMax[i] != other.pMax[i]:
-               return False
-      if len(self.pMin) != len(other.pMin):
-         return False
-      else:
-         for i in range(len(self.pMin)):
-            if self.pMin[i] != other.pMin[i]:
-               return False
-      return True
+      return self.fingerprint == other.fingerprint
    
    def __str__(self) -> str:
       result = []
@@ -206,20 +471,138 @@ class RipFile:
       return "\n".join(result)
    
    def outputData(self):
-      if self.parsed:
+      if self.parsed and self.streaming:
+         print("outputData() is not available for files parsed with streaming=True")
+      elif self.parsed:
+         # Remapped semantics (POSITION, NORMAL, TEXCOORD) don't necessarily have typeCount components any more, so go by the decoded data instead.
+         widths = [(semantic['label'], self.vertexData[semantic['label']].shape[1]) for semantic in self.semantics]
          with open("vertexLog.tsv", 'w') as log:
-            for semantic in self.semantics:
-               for i in range(semantic['typeCount']):
-                  log.write("{}[{}]\t".format(semantic['label'], i))
+            for label, width in widths:
+               for i in range(width):
+                  log.write("{}[{}]\t".format(label, i))
             log.write("\n")
             for vertex in self.vertexes:
-               for semantic in self.semantics:
-                  for i in range(semantic['typeCount']):
-                     log.write(str(vertex[semantic['label']][i]) + "\t")
+               for label, width in widths:
+                  for value in vertex[label]:
+                     log.write(str(value) + "\t")
                log.write("\n")
       else:
          print("You must parse() before outputData()")
+
+
+class RipStringTable:
+   """Read-only, list-like access to a table of NUL-terminated strings from a RIP file, each decoded the first time it is looked at
+   """
+   
+   __slots__ = ('data', 'ends', 'strings')
+   
+   def __init__(self, data, ends):
+      self.data = data
+      self.ends = ends
+      self.strings = [None] * len(ends)
+   
+   @staticmethod
+   def decode(raw):
+      """Decodes a string from a RIP file
       
+      NinjaRipper writes names as they were passed to the graphics API, which is UTF-8 for most games. Anything that isn't valid UTF-8 is assumed to be in a single-byte code page instead, which latin-1 at least decodes losslessly.
+      """
+      
+      try:
+         return raw.decode("utf-8")
+      except UnicodeDecodeError:
+         return raw.decode("latin-1")
+   
+   def __len__(self):
+      return len(self.ends)
+   
+   def __getitem__(self, index):
+      string = self.strings[index]
+      if string is None:
+         if index < 0:
+            index += len(self.ends)
+         start = self.ends[index-1] + 1 if index > 0 else 0
+         string = self.strings[index] = self.decode(self.data[start:self.ends[index]])
+      return string
+   
+   def __iter__(self):
+      for index in range(len(self.ends)):
+         yield self[index]
+
+class RipTextureList:
+   """Read-only, list-like access to the textures of a RipFile, as dicts with the 'fileName' and 'filePath' of each texture
+   """
+   
+   __slots__ = ('names', 'fileDir', 'textures')
+   
+   def __init__(self, names, fileDir):
+      self.names = names
+      self.fileDir = fileDir
+      self.textures = [None] * len(names)
+   
+   def __len__(self):
+      return len(self.names)
+   
+   def __getitem__(self, index):
+      texture = self.textures[index]
+      if texture is None:
+         fileName = self.names[index]
+         texture = self.textures[index] = {'fileName': fileName, 'filePath': os.path.join(self.fileDir, fileName)}
+      return texture
+   
+   def __iter__(self):
+      for index in range(len(self.names)):
+         yield self[index]
+
+class RipVertexList:
+   """Read-only, list-like access to the vertices of a RipFile, one RipVertex at a time
+   
+   The data stays in the per-semantic arrays of RipFile.vertexData, so this costs nothing per vertex until a vertex is actually looked at.
+   """
+   
+   __slots__ = ('columns', 'count')
+   
+   def __init__(self, columns, count):
+      self.columns = columns
+      self.count = count
+   
+   def __len__(self):
+      return self.count
+   
+   def __getitem__(self, index):
+      if index < 0:
+         index += self.count
+      if index < 0 or index >= self.count:
+         raise IndexError("Vertex index {} out of range ({} vertexes)".format(index, self.count))
+      return RipVertex(self.columns, index)
+   
+   def __iter__(self):
+      for index in range(self.count):
+         yield RipVertex(self.columns, index)
+
+class RipVertex:
+   """One vertex of a RipVertexList, read like the dicts RipFile.vertexes used to hold: vertex['index'], or vertex[label] for the data of a semantic
+   """
+   
+   __slots__ = ('columns', 'index')
+   
+   def __init__(self, columns, index):
+      self.columns = columns
+      self.index = index
+   
+   def __getitem__(self, label):
+      if label == 'index':
+         return self.index
+      return self.columns[label][self.index].tolist()
+   
+   def __contains__(self, label):
+      return label == 'index' or label in self.columns
+   
+   def keys(self):
+      return ['index'] + list(self.columns)
+   
+   def __repr__(self):
+      return str({label: self[label] for label in self.keys()})
 
 # Testing, IGNORE ME
 if __name__ == "__main__":
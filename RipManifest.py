@@ -0,0 +1,104 @@
+import os
+import json
+
+class RipManifest:
+   """Record of what importing a capture folder did with each of its RIP files, so importing the folder again can leave out the files it already handled
+   
+   The manifest is kept in "<folder>.ripmanifest.json" next to the capture folder. Each entry is keyed on the file name and holds the size and modification time the file had, the hash of its geometry (see RipFile.geometryKey), why it was skipped, and the name of the object it was imported as. An entry only counts while the file's size and modification time still match it.
+   """
+   
+   formatVersion = 1
+   
+   def __init__(self, folder):
+      self.folder = os.path.normpath(folder)
+      self.filePath = self.folder + ".ripmanifest.json"
+      self.entries = {}
+      self.load()
+   
+   def load(self):
+      """Reads the manifest file, if there is a readable one from the same formatVersion
+      """
+      
+      try:
+         with open(self.filePath, 'r') as file:
+            manifest = json.load(file)
+      except FileNotFoundError:
+         return
+      except (OSError, ValueError) as e:
+         print("Ignoring unreadable manifest {} ({})".format(self.filePath, e))
+         return
+      if manifest.get('formatVersion') == self.formatVersion:
+         self.entries = manifest.get('files', {})
+   
+   def entry(self, filePath):
+      """Gets the entry of a file, if the file hasn't changed since it was recorded
+      
+      Returns
+      -------
+      dict or None
+         the entry, or None if there is none or the file's size or modification time changed
+      """
+      
+      entry = self.entries.get(os.path.basename(filePath))
+      if entry is None:
+         return None
+      stat = os.stat(filePath)
+      if entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+         return None
+      return entry
+   
+   def skipReason(self, filePath, keep2D=False, keepUntextured=False, removeDuplicates=False, objectNames=()):
+      """Decides from the manifest alone whether a file can be left out of an incremental import, without opening it
+      
+      Parameters
+      ----------
+      objectNames : container
+         the names of the objects that exist now, like bpy.data.objects, so files whose object was deleted get imported again
+      
+      Returns
+      -------
+      str or None
+         why the file can be left out, or None if it needs to be imported
+      """
+      
+      entry = self.entry(filePath)
+      if entry is None:
+         return None
+      if entry['objectName'] is not None and entry['objectName'] in objectNames:
+         return "it was already imported as {}".format(entry['objectName'])
+      reason = entry['skipReason']
+      if (reason == "not 3D" and not keep2D) or (reason == "untextured" and not keepUntextured) or (reason == "duplicate" and removeDuplicates):
+         return "{} (from the manifest)".format(reason)
+      return None
+   
+   def record(self, ripFile, skipReason=None, objectName=None):
+      """Records what happened to a file during this import
+      
+      Parameters
+      ----------
+      ripFile : RipFile
+         the file, parsed or not
+      skipReason : str or None
+         why the file was skipped, like the result of RipFile.skipReason, or "duplicate"
+      objectName : str or None
+         the name of the object the file was imported as
+      """
+      
+      stat = os.stat(ripFile.filePath)
+      self.entries[ripFile.fileName] = {
+         'size': stat.st_size,
+         'mtime': stat.st_mtime_ns,
+         'hash': ripFile.geometryKey[2] if ripFile.parsed else None,
+         'skipReason': skipReason,
+         'objectName': objectName,
+      }
+   
+   def save(self):
+      """Writes the manifest file, leaving out the entries of files that no longer exist
+      """
+      
+      files = {name: self.entries[name] for name in sorted(self.entries) if os.path.isfile(os.path.join(self.folder, name))}
+      tempPath = self.filePath + ".tmp"
+      with open(tempPath, 'w') as file:
+         json.dump({'formatVersion': self.formatVersion, 'folder': os.path.basename(self.folder), 'files': files}, file, indent=1)
+      os.replace(tempPath, self.filePath)
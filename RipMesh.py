@@ -1,210 +1,346 @@
 import bpy
-import bmesh
-import mathutils
+import os
+import numpy
 import hashlib
-import time
-from math import floor
+from . import RipProfile
 
-class RipMesh:
-   def __init__(self, ripFile):
-      self.ripFile = ripFile
-      self.mesh = bpy.data.meshes.new(self.ripFile.fileLabel + "Mesh")
-      self.object = bpy.data.objects.new(self.ripFile.fileLabel, self.mesh)
+class RipTextureRegistry:
+   """Shares Blender images between materials, so each texture file is loaded at most once per import
    
-   def loadRip(self):
-      loadStart = time.process_time()
-      self.bmesh = bmesh.new()
-      self.bmesh.from_mesh(self.mesh)
-      bpy.context.collection.objects.link(self.object)
-      bpy.context.view_layer.objects.active = self.object
-      bpy.ops.object.mode_set(mode='EDIT', toggle=False)
-      positions = None
-      normals = None
-      uvs = []
-      for sem in self.ripFile.semantics:
-         if sem['nameUpper'] == "POSITION" and positions is None:
-            positions = sem
-         if sem['nameUpper'] == "NORMAL" and normals is None:
-            normals = sem
-         if sem['nameUpper'] == "TEXCOORD":
-            uvs.append((sem, self.bmesh.loops.layers.uv.new()))
+   Images are keyed on their normalized file path. Blender only reads the pixels of a loaded image once it is first displayed.
+   """
+   
+   def __init__(self):
+      self.images = {}
+      self.hits = 0
+      self.misses = 0
+   
+   def get(self, filePath):
+      """Gets the image of a texture file, loading it the first time
       
-      for vert in self.ripFile.vertexes:
-         vtx = self.bmesh.verts.new(vert[positions['label']])
-         vtx.normal = mathutils.Vector(vert[normals['label']][0:3]) # I've seen rips with 4-dimensional normals, no idea what the deal is with that
-         
-      self.bmesh.verts.ensure_lookup_table()
-      for f in self.ripFile.faces:
-         try:
-            face = self.bmesh.faces.new((self.bmesh.verts[f[0]], self.bmesh.verts[f[1]], self.bmesh.verts[f[2]]))
-            face.smooth = True
-            face.material_index = 0
-            
-            for uv_set_loop in range(3):
-               for z in range(len(uvs)):
-                  face.loops[uv_set_loop][uvs[z][1]].uv = self.ripFile.vertexes[f[uv_set_loop]][uvs[z][0]['label']]
-         except Exception as e:
-            print(str(e))
-      bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
-      self.bmesh.to_mesh(self.mesh)
-      self.bmesh.free()
-      # Toggling seems to fix weird mesh appearance in some cases.
-      bpy.ops.object.mode_set(mode='EDIT', toggle=False)
-      bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
-      loadTime = time.process_time() - loadStart
-      print("{}: RIP load took {}s".format(self.ripFile.fileLabel, loadTime))
-      return self.mesh
+      Returns
+      -------
+      bpy.types.Image
+         the shared image, set up to be read as non-color data
+      """
+      
+      key = os.path.normcase(os.path.abspath(filePath))
+      image = self.images.get(key)
+      if image is None:
+         image = bpy.data.images.load(filePath, check_existing=True)
+         image.colorspace_settings.is_data = True
+         image.colorspace_settings.name = "Non-Color"
+         self.images[key] = image
+         self.misses += 1
+      else:
+         self.hits += 1
+      return image
+
+class RipMaterial:
+   """Builds the Blender material of a parsed RipFile, from its textures or its pixel shader
+   
+   Parameters
+   ----------
+   ripFile : RipFile
+      the parsed file to build the material of
+   textureRegistry : RipTextureRegistry
+      where to get the images of the textures from, to share them with other materials
+   """
+   
+   # Spacing of the shader nodes laid out by RipShader.layout, which are hidden, so they only take up one line each
+   layoutColumnWidth = 200
+   layoutRowHeight = 40
    
-   def loadMaterial(self, reuseMats=True, importShaders=False):
+   def __init__(self, ripFile, textureRegistry):
+      self.ripFile = ripFile
+      self.textureRegistry = textureRegistry
       self.material = None
-      if len(self.ripFile.textures) > 0:
-         texStr = ""
-         for t in self.ripFile.textures:
-            texStr += t['fileName']
-         materialName = hashlib.md5(texStr.encode()).hexdigest()
-      else:
-         materialName = None
+   
+   @staticmethod
+   def batch(ripFiles, importShaders=False):
+      """Prepares building each distinct material of an import once, before the meshes that use them
       
-      if materialName is not None and materialName in bpy.data.materials and reuseMats:
-         self.material = bpy.data.materials[materialName]
-      elif materialName is not None:
-         self.material = bpy.data.materials.new(name=materialName)
-         self.material.use_nodes = True
-         if importShaders:
-            for shader in self.ripFile.shaders:
-               if shader.shaderType == 1:
-                  self.loadShader(shader)
-         else:
-            for t in range(len(self.ripFile.textures)):
-               tex = self.material.node_tree.nodes.new('ShaderNodeTexImage')
-               tex.image = bpy.data.images.load(self.ripFile.textures[t]['filePath'], check_existing=True)
-               tex.image.colorspace_settings.is_data = True
-               tex.image.colorspace_settings.name = "Non-Color"
-               tex.hide = True
-               tex.location = [-300, -50*t]
+      Returns
+      -------
+      dict
+         RipFile.materialSignature -> the first of ripFiles with that signature, which the material can be built from. Files without textures are left out.
+      """
       
-      if self.material is not None:
-         self.object.data.materials.append(self.material)
+      batch = {}
+      for ripFile in ripFiles:
+         signature = ripFile.materialSignature(importShaders)
+         if signature is not None and signature not in batch:
+            batch[signature] = ripFile
+      return batch
+   
+   def build(self, signature, reuseMats=True, importShaders=False):
+      """Builds the material for a RipFile.materialSignature of the file, or finds one that an earlier import built for it if reuseMats
+      
+      Returns
+      -------
+      bpy.types.Material or None
+         the material, or None if the signature is None
+      """
+      
+      with RipProfile.span("material build", self.ripFile.fileLabel):
+         self.material = None
+         materialName = hashlib.md5(repr(signature).encode()).hexdigest() if signature is not None else None
+         
+         if materialName is not None and materialName in bpy.data.materials and reuseMats:
+            self.material = bpy.data.materials[materialName]
+         elif materialName is not None:
+            self.material = bpy.data.materials.new(name=materialName)
+            self.material.use_nodes = True
+            if importShaders:
+               for shader in self.ripFile.shaders:
+                  if shader.shaderType == 1:
+                     self.loadShader(shader)
+            else:
+               for t in range(len(self.ripFile.textures)):
+                  tex = self.material.node_tree.nodes.new('ShaderNodeTexImage')
+                  tex.image = self.textureRegistry.get(self.ripFile.textures[t]['filePath'])
+                  tex.hide = True
+                  tex.location = [-300, -50*t]
       return self.material
    
    def loadShader(self, shader):
       shader.parse()
-      loadStart = time.process_time()
-      bsdf = self.material.node_tree.nodes["Principled BSDF"]
-      
-      i = 0
-      for ripNode in shader.nodes:
-         node = self.createShaderNode(ripNode)
-         x = -2000 + 600 * floor(i / 100)
-         y = 1000 - 40 * (i % 100)
-         node.location = [x,y]
-         i += 1
+      # The shader might be shared with another mesh's material, which has its own Blender nodes
+      shader.resetBuildState()
+      with RipProfile.span("node graph build", self.ripFile.fileLabel, shader=shader.fileName):
+         nodes = self.material.node_tree.nodes
+         links = self.material.node_tree.links
+         bsdf = nodes["Principled BSDF"]
+         # (RipNodeOutput of an output register, Blender node, input index) for each register component that is used
+         sockets = []
          
-      x = -2000 + 600 * floor(i / 100)
-      y = 1000 - 40 * (i % 100)
-      bsdf.location = [x,y]
-      
-      basecolor = self.material.node_tree.nodes.new("ShaderNodeCombineRGB")
-      basecolor.hide = True
-      basecolor.location = [bsdf.location[0]-170, bsdf.location[1]-100]
-      self.material.node_tree.links.new(bsdf.inputs['Base Color'], basecolor.outputs[0])
-      self.material.node_tree.links.new(bsdf.inputs['Subsurface Color'], basecolor.outputs[0])
-      self.createNodeChain(shader.registers['o1']['x'], basecolor, 0)
-      self.createNodeChain(shader.registers['o1']['y'], basecolor, 1)
-      self.createNodeChain(shader.registers['o1']['z'], basecolor, 2)
-      
-      rro1w = self.material.node_tree.nodes.new("NodeReroute")
-      rro1w.location = [bsdf.location[0]-80, bsdf.location[1]-140]
-      self.createNodeChain(shader.registers['o1']['w'], rro1w, 0)
-      
-      rro3x = self.material.node_tree.nodes.new("NodeReroute")
-      rro3x.location = [bsdf.location[0]-80, bsdf.location[1]-180]
-      self.createNodeChain(shader.registers['o3']['x'], rro3x, 0)
-      self.material.node_tree.links.new(bsdf.inputs['Subsurface'], rro3x.outputs[0])
+         basecolor = nodes.new("ShaderNodeCombineRGB")
+         basecolor.hide = True
+         basecolor.location = [bsdf.location[0]-170, bsdf.location[1]-100]
+         links.new(bsdf.inputs['Base Color'], basecolor.outputs[0])
+         links.new(bsdf.inputs['Subsurface Color'], basecolor.outputs[0])
+         sockets += [(shader.registers['o1']['x'], basecolor, 0), (shader.registers['o1']['y'], basecolor, 1), (shader.registers['o1']['z'], basecolor, 2)]
+         
+         rro1w = nodes.new("NodeReroute")
+         rro1w.location = [bsdf.location[0]-80, bsdf.location[1]-140]
+         sockets.append((shader.registers['o1']['w'], rro1w, 0))
+         
+         rro3x = nodes.new("NodeReroute")
+         rro3x.location = [bsdf.location[0]-80, bsdf.location[1]-180]
+         sockets.append((shader.registers['o3']['x'], rro3x, 0))
+         links.new(bsdf.inputs['Subsurface'], rro3x.outputs[0])
+         
+         sssradius = nodes.new("ShaderNodeCombineXYZ")
+         sssradius.hide = True
+         sssradius.location = [bsdf.location[0]-170, bsdf.location[1]-220]
+         links.new(bsdf.inputs['Subsurface Radius'], sssradius.outputs[0])
+         sockets += [(shader.registers['o3']['y'], sssradius, 0), (shader.registers['o3']['z'], sssradius, 1), (shader.registers['o3']['w'], sssradius, 2)]
+         
+         rro2 = []
+         for c in range(4):
+            reroute = nodes.new("NodeReroute")
+            reroute.location = [bsdf.location[0]-80, bsdf.location[1]-260-40*c]
+            sockets.append((shader.registers['o2']["xyzw"[c]], reroute, 0))
+            rro2.append(reroute)
+         links.new(bsdf.inputs['Roughness'], rro2[0].outputs[0])
+         links.new(bsdf.inputs['Specular'], rro2[1].outputs[0])
+         links.new(bsdf.inputs['Metallic'], rro2[2].outputs[0])
+         
+         normal = nodes.new("ShaderNodeNormalMap")
+         normal.hide = True
+         normal.location = [bsdf.location[0]-170, bsdf.location[1]-515]
+         links.new(bsdf.inputs['Normal'], normal.outputs[0])
+         normalcolor = nodes.new("ShaderNodeCombineXYZ")
+         normalcolor.hide = True
+         normalcolor.location = [bsdf.location[0]-270, bsdf.location[1]-515]
+         links.new(normal.inputs['Color'], normalcolor.outputs[0])
+         sockets += [(shader.registers['o0']['x'], normalcolor, 0), (shader.registers['o0']['y'], normalcolor, 1)]
+         
+         for c in range(2):
+            reroute = nodes.new("NodeReroute")
+            reroute.location = [bsdf.location[0]-80, bsdf.location[1]-555-40*c]
+            sockets.append((shader.registers['o0']["zw"[c]], reroute, 0))
+         
+         # Only nodes that lead to an output are created, in columns to the left of the nodes above
+         layout = shader.layout()
+         for ripNode in layout:
+            column, row = layout[ripNode]
+            node = self.createShaderNode(ripNode)
+            node.location = [bsdf.location[0] - 500 - self.layoutColumnWidth * column, bsdf.location[1] - self.layoutRowHeight * row]
+         
+         # Then every link at once, by input index. Each input socket gets exactly one link here, on new nodes, so the check for links past a socket's limit that would have to be removed (verify_limits) is skipped.
+         for ripNode in layout:
+            for id in ripNode.inputs:
+               input = ripNode.inputs[id]
+               if input.connection is not None:
+                  links.new(ripNode.blenderNode.inputs[id], input.connection.node.blenderNode.outputs[input.connection.id], verify_limits=False)
+               else:
+                  ripNode.blenderNode.inputs[id].default_value = input.defaultValue
+         for output, node, id in sockets:
+            if output is not None:
+               links.new(node.inputs[id], output.node.blenderNode.outputs[output.id], verify_limits=False)
+         
+         RipProfile.count("blender nodes", len(nodes), self.ripFile.fileLabel)
+   
+   def createShaderNode(self, ripNode):
+      ripNode.blenderNode = self.material.node_tree.nodes.new("ShaderNode"+ripNode.type)
+      ripNode.blenderNode.hide = True
+      for prop in ripNode.options:
+         if prop in ['name','label','operation','use_clamp']:
+            setattr(ripNode.blenderNode, prop, ripNode.options[prop])
+      if "imageData" in ripNode.options:
+         ripNode.blenderNode.image = self.textureRegistry.get(ripNode.options['imageData']['filePath'])
+      return ripNode.blenderNode
+
+class RipMesh:
+   """Builds the Blender object and mesh of a parsed RipFile, and gives it a material made by RipMaterial
+   
+   Parameters
+   ----------
+   ripFile : RipFile
+      the parsed file to build the mesh of
+   mesh : bpy.types.Mesh or None
+      the mesh of another RipMesh with the same RipFile.geometryKey, to link a new object to instead of building the same geometry again
+   textureRegistry : RipTextureRegistry or None
+      where to get the images of the textures from, to share them with other RipMeshes
+   """
+   
+   def __init__(self, ripFile, mesh=None, textureRegistry=None):
+      self.ripFile = ripFile
+      self.textureRegistry = textureRegistry if textureRegistry is not None else RipTextureRegistry()
+      self.instanced = mesh is not None
+      self.mesh = mesh if self.instanced else bpy.data.meshes.new(self.ripFile.fileLabel + "Mesh")
+      self.object = bpy.data.objects.new(self.ripFile.fileLabel, self.mesh)
+   
+   def loadRip(self):
+      if self.instanced:
+         bpy.context.collection.objects.link(self.object)
+         bpy.context.view_layer.objects.active = self.object
+         RipProfile.count("instanced meshes", 1, self.ripFile.fileLabel)
+         return self.mesh
+      with RipProfile.span("mesh build", self.ripFile.fileLabel):
+         positions = None
+         normals = None
+         uvs = []
+         for sem in self.ripFile.semantics:
+            if sem['nameUpper'] == "POSITION" and positions is None:
+               positions = sem
+            if sem['nameUpper'] == "NORMAL" and normals is None:
+               normals = sem
+            if sem['nameUpper'] == "TEXCOORD":
+               uvs.append(sem)
+         
+         if self.ripFile.streaming:
+            faces, vertexData = self.readChunks([sem for sem in [positions, normals] + uvs if sem is not None])
+         else:
+            faces = self.validFaces(self.ripFile.faces)
+            vertexData = self.ripFile.vertexData
+         loops = numpy.ascontiguousarray(faces, dtype=numpy.int32).ravel()
+         
+         self.mesh.vertices.add(self.ripFile.vertexCount)
+         self.mesh.vertices.foreach_set("co", numpy.ascontiguousarray(vertexData[positions['label']], dtype=numpy.float32).ravel())
+         self.mesh.loops.add(len(loops))
+         self.mesh.loops.foreach_set("vertex_index", loops)
+         self.mesh.polygons.add(len(faces))
+         self.mesh.polygons.foreach_set("loop_start", numpy.arange(0, len(loops), 3, dtype=numpy.int32))
+         # Newer versions of Blender work out loop_total from loop_start on their own.
+         if not self.mesh.polygons.bl_rna.properties['loop_total'].is_readonly:
+            self.mesh.polygons.foreach_set("loop_total", numpy.full(len(faces), 3, dtype=numpy.int32))
+         self.mesh.polygons.foreach_set("use_smooth", numpy.ones(len(faces), dtype=bool))
+         for sem in uvs:
+            layer = self.mesh.uv_layers.new(name=sem['label'])
+            layer.data.foreach_set("uv", numpy.ascontiguousarray(vertexData[sem['label']][loops], dtype=numpy.float32).ravel())
+         self.mesh.update(calc_edges=True)
+         # Gets rid of duplicate faces, which bmesh also used to refuse.
+         self.mesh.validate(clean_customdata=False)
+         
+         if normals is not None:
+            if hasattr(self.mesh, "use_auto_smooth"):
+               self.mesh.use_auto_smooth = True
+            self.mesh.normals_split_custom_set_from_vertices(numpy.ascontiguousarray(vertexData[normals['label']][:,0:3], dtype=numpy.float32))
+         
+         bpy.context.collection.objects.link(self.object)
+         bpy.context.view_layer.objects.active = self.object
+      return self.mesh
+   
+   def readChunks(self, semantics):
+      """Collects the faces and some of the vertex data of a RIP file that was parsed with streaming=True
       
-      sssradius = self.material.node_tree.nodes.new("ShaderNodeCombineXYZ")
-      sssradius.hide = True
-      sssradius.location = [bsdf.location[0]-170, bsdf.location[1]-220]
-      self.material.node_tree.links.new(bsdf.inputs['Subsurface Radius'], sssradius.outputs[0])
-      self.createNodeChain(shader.registers['o3']['y'], sssradius, 0)
-      self.createNodeChain(shader.registers['o3']['z'], sssradius, 1)
-      self.createNodeChain(shader.registers['o3']['w'], sssradius, 2)
+      The file is decoded one chunk at a time, straight into arrays that are allocated once at their final size, so the whole file is never decoded in memory at once.
       
-      rro2x = self.material.node_tree.nodes.new("NodeReroute")
-      rro2y = self.material.node_tree.nodes.new("NodeReroute")
-      rro2z = self.material.node_tree.nodes.new("NodeReroute")
-      rro2w = self.material.node_tree.nodes.new("NodeReroute")
-      rro2x.location = [bsdf.location[0]-80, bsdf.location[1]-260]
-      rro2y.location = [bsdf.location[0]-80, bsdf.location[1]-300]
-      rro2z.location = [bsdf.location[0]-80, bsdf.location[1]-340]
-      rro2w.location = [bsdf.location[0]-80, bsdf.location[1]-380]
-      self.createNodeChain(shader.registers['o2']['x'], rro2x, 0)
-      self.createNodeChain(shader.registers['o2']['y'], rro2y, 0)
-      self.createNodeChain(shader.registers['o2']['z'], rro2z, 0)
-      self.createNodeChain(shader.registers['o2']['w'], rro2w, 0)
-      self.material.node_tree.links.new(bsdf.inputs['Roughness'], rro2x.outputs[0])
-      self.material.node_tree.links.new(bsdf.inputs['Specular'], rro2y.outputs[0])
-      self.material.node_tree.links.new(bsdf.inputs['Metallic'], rro2z.outputs[0])
+      Parameters
+      ----------
+      semantics : list[dict]
+         the POSITION, NORMAL and TEXCOORD semantics to collect the data of
       
-      normal = self.material.node_tree.nodes.new("ShaderNodeNormalMap")
-      normal.hide = True
-      normal.location = [bsdf.location[0]-170, bsdf.location[1]-515]
-      self.material.node_tree.links.new(bsdf.inputs['Normal'], normal.outputs[0])
-      normalcolor = self.material.node_tree.nodes.new("ShaderNodeCombineXYZ")
-      normalcolor.hide = True
-      normalcolor.location = [bsdf.location[0]-270, bsdf.location[1]-515]
-      self.material.node_tree.links.new(normal.inputs['Color'], normalcolor.outputs[0])
-      self.createNodeChain(shader.registers['o0']['x'], normalcolor, 0)
-      self.createNodeChain(shader.registers['o0']['y'], normalcolor, 1)
+      Returns
+      -------
+      tuple
+         the valid faces as a (count, 3) int32 array, and a dict like RipFile.vertexData holding float32 arrays for the given semantics
+      """
       
-      rro0z = self.material.node_tree.nodes.new("NodeReroute")
-      rro0w = self.material.node_tree.nodes.new("NodeReroute")
-      rro0z.location = [bsdf.location[0]-80, bsdf.location[1]-555]
-      rro0w.location = [bsdf.location[0]-80, bsdf.location[1]-595]
-      self.createNodeChain(shader.registers['o0']['z'], rro0z, 0)
-      self.createNodeChain(shader.registers['o0']['w'], rro0w, 0)
+      vertexData = {}
+      for sem in semantics:
+         width = len(self.ripFile.parseOptions['uvOrder'] if sem['nameUpper'] == "TEXCOORD" else self.ripFile.parseOptions['xyzOrder'])
+         vertexData[sem['label']] = numpy.empty((self.ripFile.vertexCount, width), dtype=numpy.float32)
+      for start, chunk in self.ripFile.vertexChunks():
+         for label in vertexData:
+            vertexData[label][start:start+len(chunk[label])] = chunk[label]
       
-      loadTime = time.process_time() - loadStart
-      print("{} ({}): Material creation took {}s".format(self.ripFile.fileLabel, shader.fileName, loadTime))
+      faces = numpy.empty((self.ripFile.faceCount, 3), dtype=numpy.int32)
+      count = 0
+      for chunk in self.ripFile.faceChunks():
+         chunk = self.validFaces(chunk)
+         faces[count:count+len(chunk)] = chunk
+         count += len(chunk)
+      return faces[:count], vertexData
    
-   def createNodeChain(self, ripNodeOutput, previousNode, inputId):
-      '''Create the entire chain of nodes that ends with the given node.
+   def validFaces(self, faces):
+      # bmesh used to refuse faces that use the same vertex twice or vertices that don't exist, so leave those out here too. Blender can crash on the latter when calculating edges.
+      if self.ripFile.invalidFaceCount == 0:
+         return faces
+      return faces[self.ripFile.faceMask(faces)]
+   
+   def loadMaterial(self, reuseMats=True, importShaders=False, materials=None):
+      """Gives the object a material for its textures, or its pixel shader if importShaders
       
       Parameters
       ----------
-      ripNodeOutput : RipNodeOutput
-         the simulated output that we need to create a node for and then connect to the input
-      previousNode : bpy.types.ShaderNode
-         the existing node who inputs we need to link
-      inputId : int or str
-         the id of the input of previousNode that we are creating a link for
-      '''
+      reuseMats : bool
+         use a material that was built for the same RipFile.materialSignature before, instead of building another one
+      importShaders : bool
+         build the material from the pixel shader instead of just adding the textures to it
+      materials : dict or None
+         materials already built during this import, by signature, which the new material is added to
       
-      ripNode = ripNodeOutput.node
-      if ripNode.blenderNode is None:
-         createShaderNode(self, ripNode)
-         ripNode.blenderNode.location = [previousNode.location[0]-170, previousNode.location[1]+int(inputId)*40]
-      self.material.node_tree.links.new(previousNode.inputs[inputId], ripNode.blenderNode.outputs[ripNodeOutput.id])
-      if not ripNode.handled:
-         for id in ripNode.inputs:
-            if ripNode.inputs[id].connection is not None:
-               self.createNodeChain(ripNode.inputs[id].connection, ripNode.blenderNode, id)
-            else:
-               ripNode.blenderNode.inputs[id].default_value = ripNode.inputs[id].defaultValue
-         ripNode.handled = True
-   
-   def createShaderNode(self, ripNode):
-      ripNode.blenderNode = self.material.node_tree.nodes.new("ShaderNode"+ripNode.type)
-      ripNode.blenderNode.hide = True
-      for prop in ripNode.options:
-         if prop in ['name','label','operation','use_clamp']:
-            setattr(ripNode.blenderNode, prop, ripNode.options[prop])
-      if "imageData" in ripNode.options:
-         ripNode.blenderNode.image = bpy.data.images.load(ripNode.options['imageData']['filePath'], check_existing=True)
-         ripNode.blenderNode.image.colorspace_settings.is_data = True
-         ripNode.blenderNode.image.colorspace_settings.name = "Non-Color"
-      return ripNode.blenderNode
+      Returns
+      -------
+      bpy.types.Material or None
+         the material, or None if the file has no textures
+      """
+      
+      signature = self.ripFile.materialSignature(importShaders)
+      if reuseMats and materials is not None and signature in materials:
+         self.material = materials[signature]
+      else:
+         self.material = RipMaterial(self.ripFile, self.textureRegistry).build(signature, reuseMats, importShaders)
+         if materials is not None and signature is not None:
+            materials[signature] = self.material
+      
+      if self.instanced:
+         # The mesh and its material slot belong to the first object, so a different material goes in a slot linked to this object instead
+         if self.material != (self.mesh.materials[0] if len(self.mesh.materials) > 0 else None):
+            if len(self.mesh.materials) == 0:
+               self.mesh.materials.append(None)
+            slot = self.object.material_slots[0]
+            slot.link = 'OBJECT'
+            slot.material = self.material
+      elif self.material is not None:
+         self.object.data.materials.append(self.material)
+      return self.material
    
    def delete(self):
       bpy.data.objects.remove(self.object)
-      bpy.data.meshes.remove(self.mesh)
+      # Other objects might still be using an instanced mesh
+      if self.mesh.users == 0:
+         bpy.data.meshes.remove(self.mesh)
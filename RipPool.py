@@ -0,0 +1,181 @@
+import os
+import sys
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy
+
+try:
+   from multiprocessing import shared_memory
+except ImportError:
+   # Python 3.7 (Blender 2.8x) has no shared memory, the arrays will be pickled back to the parent instead.
+   shared_memory = None
+
+# Needed for stand-alone tests and for the worker processes, which import these modules outside of the add-on package
+if __package__:
+   from .RipFile import RipFile
+   from . import RipProfile
+else:
+   from RipFile import RipFile
+   import RipProfile
+
+# Below this many vertices in total, parsing the files one at a time is done before the worker processes would even have started: parsing runs at about 3 million vertices a second on one core, while starting the workers takes from a fraction of a second to a few seconds.
+parallelVertexCount = 4000000
+
+# Shared memory blocks created by this worker process. Windows frees a block as soon as nobody has a handle open to it, so the worker has to keep its handle until the parent process has attached.
+sharedBlocks = []
+
+def parseWorker(filePath, options):
+   """Parses one RIP file in a worker process
+   
+   Parameters
+   ----------
+   filePath : str
+      the RIP file to parse
+   options : dict
+      keyword arguments for RipFile.parse
+   
+   Returns
+   -------
+   dict or None
+      the RipFile.parsedState of the file, with its arrays moved into shared memory if possible, or None if the file was skipped
+   """
+   
+   rip = RipFile(filePath)
+   if not rip.parse(**options):
+      return None
+   state = rip.parsedState()
+   if shared_memory is not None:
+      state['arrays'] = shareArrays(state['arrays'])
+   return state
+
+def shareArrays(arrays):
+   """Copies a dict of arrays into a single shared memory block
+   
+   Returns
+   -------
+   dict
+      'shm': the name of the block, 'layout': a list of (name, dtype, shape, offset) for each array
+   """
+   
+   layout = []
+   size = 0
+   for name in arrays:
+      array = arrays[name]
+      layout.append((name, array.dtype.str, array.shape, size))
+      size += (array.nbytes + 15) & ~15
+   block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+   for name, dtype, shape, offset in layout:
+      numpy.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)[...] = arrays[name]
+   if os.name == "nt":
+      sharedBlocks.append(block)
+   else:
+      block.close()
+   return {'shm': block.name, 'layout': layout}
+
+def unshareArrays(shared):
+   """Copies the arrays out of a block made by shareArrays, then frees the block
+   """
+   
+   block = shared_memory.SharedMemory(name=shared['shm'])
+   try:
+      arrays = {}
+      for name, dtype, shape, offset in shared['layout']:
+         arrays[name] = numpy.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset).copy()
+   finally:
+      block.close()
+      block.unlink()
+   return arrays
+
+def worthParallelParsing(ripFiles):
+   """Decides whether parsing RipFiles in worker processes is likely to be faster than parsing them one at a time
+   
+   Parameters
+   ----------
+   ripFiles : list[RipFile]
+      the scanned files to parse
+   
+   Returns
+   -------
+   bool
+      True if there is more than one file and one CPU core, and at least parallelVertexCount vertices in total
+   """
+   
+   return len(ripFiles) > 1 and (os.cpu_count() or 1) > 1 and sum(rip.vertexCount for rip in ripFiles) >= parallelVertexCount
+
+def parseSteps(ripFiles, processes=None, executable=None, pollInterval=0.05, **options):
+   """Parses RipFiles in a pool of worker processes, as a generator, which yields at least every pollInterval seconds while it waits for the workers
+   
+   Only the decoding happens in the workers. The decoded arrays are sent back through shared memory and loaded into the given RipFile objects with RipFile.loadParsedState, as the workers finish them, on the thread that runs the generator. Files that fail to parse in a worker are left unparsed, so the caller can retry them on the main thread. If the generator is closed early, the files that weren't started yet are cancelled, and the rest are left unparsed.
+   
+   Parameters
+   ----------
+   ripFiles : list[RipFile]
+      the files to parse
+   processes : int or None
+      how many worker processes to use, or None for one per CPU core, but never more than there are files
+   executable : str or None
+      the Python interpreter to start the workers with, if it is not sys.executable (as in Blender 2.8x, where sys.executable is Blender itself)
+   pollInterval : float
+      the longest time in seconds to wait for the workers before yielding
+   options : dict
+      keyword arguments for RipFile.parse
+   
+   Yields
+   ------
+   tuple
+      how many of the files are done, and how many of those were parsed
+   """
+   
+   with RipProfile.span("parallel parse", files=len(ripFiles)):
+      # The workers can't import the add-on package, because its __init__ needs bpy, so they get this module as a top-level module from the add-on directory instead.
+      # That is only needed while the pool runs, and afterwards would let anything else import these modules by their bare names, so it is undone then.
+      addonDir = os.path.dirname(os.path.abspath(__file__))
+      addedPath = addonDir not in sys.path
+      if addedPath:
+         sys.path.append(addonDir)
+      modulesBefore = set(sys.modules)
+      parsed = 0
+      try:
+         worker = importlib.import_module("RipPool").parseWorker
+         
+         context = multiprocessing.get_context("spawn")
+         if executable is not None:
+            context.set_executable(executable)
+         # More workers than files would only cost start-up time
+         processes = min(processes or os.cpu_count() or 1, max(len(ripFiles), 1))
+         with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+            pending = {pool.submit(worker, rip.filePath, options): rip for rip in ripFiles}
+            try:
+               while pending:
+                  finished, notFinished = wait(pending, timeout=pollInterval, return_when=FIRST_COMPLETED)
+                  for future in finished:
+                     rip = pending.pop(future)
+                     try:
+                        state = future.result()
+                     except Exception as e:
+                        print("{}: parse failed in worker process ({})".format(rip.fileLabel, e))
+                        continue
+                     if state is None:
+                        continue
+                     if 'shm' in state['arrays']:
+                        state['arrays'] = unshareArrays(state['arrays'])
+                     rip.loadParsedState(state)
+                     parsed += 1
+                  yield len(ripFiles) - len(pending), parsed
+            finally:
+               for future in pending:
+                  future.cancel()
+               # Shared memory sent back for files that won't be loaded anymore still has to be freed
+               for future in pending:
+                  if not future.cancelled() and future.exception() is None:
+                     state = future.result()
+                     if state is not None and 'shm' in state['arrays']:
+                        unshareArrays(state['arrays'])
+      finally:
+         if addedPath:
+            sys.path.remove(addonDir)
+         for name in set(sys.modules) - modulesBefore:
+            if os.path.dirname(os.path.abspath(getattr(sys.modules[name], '__file__', None) or "")) == addonDir:
+               del sys.modules[name]
+   RipProfile.count("files parsed in workers", parsed)
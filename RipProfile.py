@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+import contextlib
+
+class RipSpan:
+   """One timed, possibly nested, section of an import, made by RipProfiler.span
+   """
+   
+   __slots__ = ('profiler', 'name', 'file', 'args', 'start', 'end', 'depth')
+   
+   def __init__(self, profiler, name, file, args):
+      self.profiler = profiler
+      self.name = name
+      self.file = file
+      self.args = args
+      self.start = None
+      self.end = None
+      self.depth = 0
+   
+   def __enter__(self):
+      self.depth = self.profiler.depth
+      self.profiler.depth += 1
+      self.start = time.perf_counter()
+      return self
+   
+   def __exit__(self, excType, excValue, traceback):
+      self.end = time.perf_counter()
+      self.profiler.depth -= 1
+      self.profiler.spans.append(self)
+      return False
+
+class RipProfiler:
+   """Collects timing spans and counters for one import
+   
+   Parameters
+   ----------
+   profileCalls : bool
+      also run cProfile for the whole session, and put the slowest functions in the report
+   traceMemory : bool
+      also run tracemalloc for the whole session, and put the peak and the biggest allocations in the report
+   """
+   
+   def __init__(self, profileCalls=False, traceMemory=False):
+      self.spans = []
+      self.depth = 0
+      self.counters = {} # file label (or None for the whole import) -> counter name -> value
+      self.startTime = time.perf_counter()
+      self.endTime = None
+      self.calls = cProfile.Profile() if profileCalls else None
+      self.traceMemory = traceMemory
+      self.memory = None
+      if self.calls is not None:
+         self.calls.enable()
+      if self.traceMemory:
+         tracemalloc.start()
+   
+   def span(self, name, file=None, **args):
+      return RipSpan(self, name, file, args)
+   
+   def count(self, name, value=1, file=None):
+      counters = self.counters.setdefault(file, {})
+      counters[name] = counters.get(name, 0) + value
+   
+   def stop(self):
+      """Ends the session, stopping cProfile and tracemalloc if they were running
+      """
+      
+      self.endTime = time.perf_counter()
+      if self.calls is not None:
+         self.calls.disable()
+      if self.traceMemory:
+         current, peak = tracemalloc.get_traced_memory()
+         top = tracemalloc.take_snapshot().statistics('lineno')[:25]
+         tracemalloc.stop()
+         self.memory = {
+            'peakBytes': peak,
+            'top': [{'location': str(stat.traceback), 'bytes': stat.size, 'count': stat.count} for stat in top],
+         }
+   
+   def totals(self):
+      """Adds up the time spent in each kind of span
+      
+      Returns
+      -------
+      dict
+         span name -> [number of spans, total seconds]
+      """
+      
+      totals = {}
+      for span in self.spans:
+         total = totals.setdefault(span.name, [0, 0.0])
+         total[0] += 1
+         total[1] += span.end - span.start
+      return totals
+   
+   def summary(self):
+      """Formats the span totals and the counters (added up over all files) for the console
+      """
+      
+      lines = ["Import took {:.3f}s".format((self.endTime or time.perf_counter()) - self.startTime)]
+      totals = self.totals()
+      for name in sorted(totals, key=lambda n: -totals[n][1]):
+         lines.append("  {:<24} {:>6} x {:>10.3f}s".format(name, totals[name][0], totals[name][1]))
+      counters = {}
+      for fileCounters in self.counters.values():
+         for name in fileCounters:
+            counters[name] = counters.get(name, 0) + fileCounters[name]
+      for name in sorted(counters):
+         lines.append("  {:<24} {:>10}".format(name, counters[name]))
+      return "\n".join(lines)
+   
+   def report(self):
+      """Builds the report written by writeReport
+      
+      Returns
+      -------
+      dict
+         the spans as Chrome trace events ('traceEvents', in microseconds), which chrome://tracing and Perfetto can open, plus 'totals', 'counters' and, if enabled, 'calls' and 'memory'
+      """
+      
+      pid = os.getpid()
+      events = []
+      for span in self.spans:
+         args = dict(span.args)
+         if span.file is not None:
+            args['file'] = span.file
+         events.append({
+            'name': span.name,
+            'cat': "import",
+            'ph': "X",
+            'ts': (span.start - self.startTime) * 1000000,
+            'dur': (span.end - span.start) * 1000000,
+            'pid': pid,
+            'tid': span.depth,
+            'args': args,
+         })
+      result = {
+         'traceEvents': events,
+         'displayTimeUnit': "ms",
+         'totals': {name: {'count': total[0], 'seconds': total[1]} for name, total in self.totals().items()},
+         'counters': {"" if file is None else file: counters for file, counters in self.counters.items()},
+      }
+      if self.calls is not None:
+         stats = pstats.Stats(self.calls)
+         calls = []
+         for (fileName, line, function), (primitive, total, ownTime, cumulative, callers) in stats.stats.items():
+            calls.append({'function': "{}:{}({})".format(fileName, line, function), 'calls': total, 'ownSeconds': ownTime, 'cumulativeSeconds': cumulative})
+         calls.sort(key=lambda c: -c['cumulativeSeconds'])
+         result['calls'] = calls[:100]
+      if self.memory is not None:
+         result['memory'] = self.memory
+      return result
+   
+   def writeReport(self, filePath):
+      with open(filePath, 'w') as file:
+         json.dump(self.report(), file)
+
+# The profiler of the import that is currently running, if any. span() and count() do nothing without one.
+session = None
+
+def begin(profileCalls=False, traceMemory=False):
+   global session
+   session = RipProfiler(profileCalls, traceMemory)
+   return session
+
+def end():
+   global session
+   profiler = session
+   session = None
+   if profiler is not None:
+      profiler.stop()
+   return profiler
+
+def span(name, file=None, **args):
+   """Times a section of code as part of the current session, as a context manager
+   """
+   
+   if session is None:
+      return contextlib.nullcontext()
+   return session.span(name, file, **args)
+
+def count(name, value=1, file=None):
+   """Adds to a counter of the current session, for a file if given, or for the whole import
+   """
+   
+   if session is not None:
+      session.count(name, value, file)
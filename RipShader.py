@@ -1,10 +1,16 @@
 import os
 import re
+import math
 import struct
-import time
 from math import floor
 from functools import reduce
 
+# Needed for stand-alone tests and for RipPool worker processes, which import these modules outside of the add-on package
+if __package__:
+   from . import RipProfile
+else:
+   import RipProfile
+
 def float_to_hex(f):
    if type(f) is float:
       return hex(struct.unpack('<I', struct.pack('<f', f))[0])
@@ -15,6 +21,11 @@ class RipShader:
    cbRegEx = re.compile("//\s+([a-zA-Z0-9_]+)\s+([a-zA-Z0-9_]+);\s*//\s+Offset:\s+(\d+)\s+Size:\s+(\d+)")
    rRegEx = re.compile("//\s+([a-zA-Z0-9_]+)\s+([a-zA-Z0-9_]+)\s+([a-zA-Z0-9_]+)\s+([a-zA-Z0-9_]+)\s+(\d+)\s+(\d+)")
    ioRegEx = re.compile("//\s+([a-zA-Z0-9_]+)\s+(\d+)\s+([xyzw]+)\s+(\d+)\s+([a-zA-Z0-9_]+)\s+([a-zA-Z0-9_]+)\s+([xyzw]+)")
+   # A word of an ASM line: either a number list like l(1.0, 0, 0, 0) (group 1), or anything up to the next space or comma that isn't in parentheses (group 2)
+   tokenRegEx = re.compile(r"l\(([^)]*)\)|((?:[^\s,(]|\([^)]*\))+)")
+   numberRegEx = re.compile(r"[^\s,]+")
+   # A dest or src term, like -|cb0[12].xyzw|: negative, absolute, register, index, mask or swizzle
+   operandRegEx = re.compile(r"(-)?(\|)?([^-|\[\].]+)(?:\[([^\]]*)\])?(?:\.([xyzw]+))?\|?")
    
    def __init__(self, fileDir, fileName, textures):
       self.fileDir = fileDir
@@ -32,432 +43,508 @@ class RipShader:
       self.shaderVersion = ""
       self.globalFlags = []
    
-   def parse(self):
-      loadStart = time.process_time()
-      self.data = {
-         'buffers': {
-         },
-         'resources': {
-         },
-         'input': {
-         },
-         'output': {
-         }
-      }
-      self.registers = {}
-      self.nodes = [] # RipNode instances will add themselves to this
-      with open(self.filePath, 'r') as file:
-         self.currentLine = 0
-         self.currentBlock = {
-            'name': None,
-            'type': None,
-            'status': 0
+   def parse(self, optimize=True):
+      """Parses the shader file into registers and RipNodes, unless that was already done
+      
+      Parameters
+      ----------
+      optimize : bool
+         whether to shrink the node graph with optimize() afterwards
+      """
+      
+      if self.parsed:
+         return
+      with RipProfile.span("shader parse", self.fileName):
+         self.data = {
+            'buffers': {
+            },
+            'resources': {
+            },
+            'input': {
+            },
+            'output': {
+            }
          }
-         self.ignoring = False
-         for line in file:
-            self.currentLine += 1
-            if line.startswith("//"):
-               if self.currentBlock['status'] == 0:
-                  if line.startswith("// cbuffer "):
-                     self.currentBlock['name'] = line[11:].strip()
-                     self.currentBlock['type'] = "cbuffer"
-                     self.currentBlock['status'] = 1
-                     
-                  elif line.startswith("// Resource Bindings:"):
-                     self.currentBlock['name'] = "resources"
-                     self.currentBlock['type'] = "other"
-                     self.currentBlock['status'] = 1
+         self.registers = {}
+         # term -> parsed term, since the same terms come up over and over
+         self.destTerms = {}
+         self.srcTerms = {}
+         self.nodes = [] # RipNode instances will add themselves to this
+         self.instructionLines = set() # line numbers of the instructions, as opposed to declarations
+         with open(self.filePath, 'r') as file:
+            self.currentLine = 0
+            self.currentBlock = {
+               'name': None,
+               'type': None,
+               'status': 0
+            }
+            self.ignoring = False
+            self.instructionCount = 0
+            for line in file:
+               self.currentLine += 1
+               if line.startswith("//"):
+                  if self.currentBlock['status'] == 0:
+                     if line.startswith("// cbuffer "):
+                        self.currentBlock['name'] = line[11:].strip()
+                        self.currentBlock['type'] = "cbuffer"
+                        self.currentBlock['status'] = 1
                      
-                  elif line.startswith("// Input signature:"):
-                     self.currentBlock['name'] = "input"
-                     self.currentBlock['type'] = "other"
-                     self.currentBlock['status'] = 1
+                     elif line.startswith("// Resource Bindings:"):
+                        self.currentBlock['name'] = "resources"
+                        self.currentBlock['type'] = "other"
+                        self.currentBlock['status'] = 1
                      
-                  elif line.startswith("// Output signature:"):
-                     self.currentBlock['name'] = "output"
-                     self.currentBlock['type'] = "other"
-                     self.currentBlock['status'] = 1
+                     elif line.startswith("// Input signature:"):
+                        self.currentBlock['name'] = "input"
+                        self.currentBlock['type'] = "other"
+                        self.currentBlock['status'] = 1
                      
-               elif self.currentBlock['status'] == 1:
-                  if self.currentBlock['type'] == "cbuffer" and line.startswith("// {"):
-                     self.currentBlock['status'] = 2
-                     self.data['buffers'][self.currentBlock['name']] = {}
+                     elif line.startswith("// Output signature:"):
+                        self.currentBlock['name'] = "output"
+                        self.currentBlock['type'] = "other"
+                        self.currentBlock['status'] = 1
+                  
+                  elif self.currentBlock['status'] == 1:
+                     if self.currentBlock['type'] == "cbuffer" and line.startswith("// {"):
+                        self.currentBlock['status'] = 2
+                        self.data['buffers'][self.currentBlock['name']] = {}
                      
-                  elif self.currentBlock['type'] == "other" and line.startswith("// Name"):
-                     self.currentBlock['status'] = 2
+                     elif self.currentBlock['type'] == "other" and line.startswith("// Name"):
+                        self.currentBlock['status'] = 2
+                  
+                  elif self.currentBlock['status'] == 2:
+                     if self.currentBlock['type'] == "cbuffer":
+                        if line.startswith("// }"):
+                           self.currentBlock['name'] = None
+                           self.currentBlock['type'] = None
+                           self.currentBlock['status'] = 0
+                        
+                        elif line.find("[unused]") == -1:
+                           match = self.cbRegEx.search(line)
+                           if match:
+                              type, name, offset, size = match.group(1,2,3,4)
+                              offset = int(int(offset)/4)
+                              size = int(int(size)/4)
+                              for x in range(offset, offset+size):
+                                 idx = str(int(x/4))
+                                 part = str("xyzw"[int(x%4)])
+                                 if idx in self.data['buffers'][self.currentBlock['name']]:
+                                    self.data['buffers'][self.currentBlock['name']][idx][part] = {'name':name+"."+part, 'originalSize':size}
+                                 else:
+                                    self.data['buffers'][self.currentBlock['name']][idx] = {part:{'name':name+"."+part, 'originalSize':size}}
                      
-               elif self.currentBlock['status'] == 2:
-                  if self.currentBlock['type'] == "cbuffer":
-                     if line.startswith("// }"):
-                        self.currentBlock['name'] = None
-                        self.currentBlock['type'] = None
-                        self.currentBlock['status'] = 0
+                     elif self.currentBlock['type'] == "other":
+                        if line.strip() == "//":
+                           self.currentBlock['name'] = None
+                           self.currentBlock['type'] = None
+                           self.currentBlock['status'] = 0
                         
-                     elif line.find("[unused]") == -1:
-                        match = self.cbRegEx.search(line)
-                        if match:
-                           type, name, offset, size = match.group(1,2,3,4)
-                           offset = int(int(offset)/4)
-                           size = int(int(size)/4)
-                           for x in range(offset, offset+size):
-                              idx = str(int(x/4))
-                              part = str("xyzw"[int(x%4)])
-                              if idx in self.data['buffers'][self.currentBlock['name']]:
-                                 self.data['buffers'][self.currentBlock['name']][idx][part] = {'name':name+"."+part, 'originalSize':size}
-                              else:
-                                 self.data['buffers'][self.currentBlock['name']][idx] = {part:{'name':name+"."+part, 'originalSize':size}}
-                                 
-                  elif self.currentBlock['type'] == "other":
-                     if line.strip() == "//":
-                        self.currentBlock['name'] = None
-                        self.currentBlock['type'] = None
-                        self.currentBlock['status'] = 0
+                        elif self.currentBlock['name'] == "resources":
+                           match = self.rRegEx.search(line)
+                           if match:
+                              name, type, format, dim, slot, elements = match.group(1,2,3,4,5,6)
+                              if type == "texture":
+                                 try:
+                                    i = len(list(filter(lambda x:x[0]=="t", self.data['resources'])))
+                                    self.data['resources']['t'+slot] = {'name':name, 'data':self.textures[i]}
+                                 except IndexError:
+                                    print("Texture resource declaration '{}' exceeds the number of stored textures ({}/{}) (line {})".format(name, i, len(self.textures), self.currentLine))
+                              elif type == "cbuffer":
+                                 try:
+                                    self.data['resources']['cb'+slot] = {'name':name, 'data':self.data['buffers'][name]}
+                                 except IndexError:
+                                    print("Buffer resource declaration refers to undefined buffer '{}' (line {})".format(name, self.currentLine))
+                              elif type == "sampler":
+                                 self.data['resources']['s'+slot] = {'name':name}
                         
-                     elif self.currentBlock['name'] == "resources":
-                        match = self.rRegEx.search(line)
-                        if match:
-                           name, type, format, dim, slot, elements = match.group(1,2,3,4,5,6)
-                           if type == "texture":
-                              try:
-                                 i = len(list(filter(lambda x:x[0]=="t", self.data['resources'])))
-                                 self.data['resources']['t'+slot] = {'name':name, 'data':self.textures[i]}
-                              except IndexError:
-                                 print("Texture resource declaration '{}' exceeds the number of stored textures ({}/{}) (line {})".format(name, i, len(self.textures), self.currentLine))
-                           elif type == "cbuffer":
-                              try:
-                                 self.data['resources']['cb'+slot] = {'name':name, 'data':self.data['buffers'][name]}
-                              except IndexError:
-                                 print("Buffer resource declaration refers to undefined buffer '{}' (line {})".format(name, self.currentLine))
-                           elif type == "sampler":
-                              self.data['resources']['s'+slot] = {'name':name}
-                              
-                     elif self.currentBlock['name'] == "input" or self.currentBlock['name'] == "output":
-                        match = self.ioRegEx.search(line)
-                        if match:
-                           # If oDepthLE is present, it will be skipped, because it doesn't match the RegEx. However, it will still be handled in the ASM.
-                           name, index, mask, register, sysvalue, format, used = match.group(1,2,3,4,5,6,7)
-                           reg = 'v'+register if self.currentBlock['name']=="input" else 'o'+register
-                           data = {'name':name, 'index':index}
-                           for c in mask:
-                              if reg in self.data[self.currentBlock['name']]:
-                                 self.data[self.currentBlock['name']][reg][c] = data
-                              else:
-                                 self.data[self.currentBlock['name']][reg] = {c:data}
-                           # input of .vs is the vertex data
-                           # input of .ps is matched to the output of .vs
-                           # (all of the below might only apply to BG3)
-                           #  o0 seems to relate to the normal map
-                           #  o1 looks like the RGB base colors, unsure what the 'w' component is (it's not alpha)
-                           #  o2 seems to contain reflectance data
-                           #  o3 might be subsurface data
-            else:
-               self.handleASM(line)
-      self.parsed = True
-      loadTime = time.process_time() - loadStart
-      print("{}: Shader parse took {}s".format(self.fileName, loadTime))
+                        elif self.currentBlock['name'] == "input" or self.currentBlock['name'] == "output":
+                           match = self.ioRegEx.search(line)
+                           if match:
+                              # If oDepthLE is present, it will be skipped, because it doesn't match the RegEx. However, it will still be handled in the ASM.
+                              name, index, mask, register, sysvalue, format, used = match.group(1,2,3,4,5,6,7)
+                              reg = 'v'+register if self.currentBlock['name']=="input" else 'o'+register
+                              data = {'name':name, 'index':index}
+                              for c in mask:
+                                 if reg in self.data[self.currentBlock['name']]:
+                                    self.data[self.currentBlock['name']][reg][c] = data
+                                 else:
+                                    self.data[self.currentBlock['name']][reg] = {c:data}
+                              # input of .vs is the vertex data
+                              # input of .ps is matched to the output of .vs
+                              # (all of the below might only apply to BG3)
+                              #  o0 seems to relate to the normal map
+                              #  o1 looks like the RGB base colors, unsure what the 'w' component is (it's not alpha)
+                              #  o2 seems to contain reflectance data
+                              #  o3 might be subsurface data
+               else:
+                  self.instructionCount += 1
+                  self.handleASM(line)
+         RipProfile.count("instructions", self.instructionCount, self.fileName)
+         RipProfile.count("nodes", len(self.nodes), self.fileName)
+         self.deadInstructions = self.findDeadInstructions()
+         if len(self.deadInstructions) > 0:
+            print("{}: {} of {} instructions don't affect any output".format(self.fileName, len(self.deadInstructions), len(self.instructionLines)))
+            RipProfile.count("dead instructions", len(self.deadInstructions), self.fileName)
+         if optimize:
+            with RipProfile.span("shader optimize", self.fileName):
+               RipProfile.count("nodes optimized away", self.optimize(), self.fileName)
+         self.parsed = True
    
    def handleASM(self, line):
-      words = self.parseASM(line)
-      if words[0] == "ret":
-         return False
-         
-      elif words[0].startswith("vs_") or words[0].startswith("ps_"):
-         self.shaderVersion = words[0]
-         
-      elif words[0] == "dcl_sampler":
-         pass
-         # Don't know what to do with these, probably nothing
-         # Different samplers require different handling, but there's no way to automatically detect what
-         
-      elif words[0] == "dcl_globalFlags":
-         self.globalFlags += words[1:]
-         
-      elif words[0] == "dcl_constantbuffer":
-         if words[2] == "immediateIndexed":
-            parts = words[1].split("[")
-            if len(parts) > 1:
-               for i in self.data['resources'][parts[0]]['data']:
-                  for c in self.data['resources'][parts[0]]['data'][i]:
-                     node = RipNode(self, "Value")
-                     if parts[0] not in self.registers:
-                        self.registers[parts[0]] = {}
-                     if i not in self.registers[parts[0]]:
-                        self.registers[parts[0]][i] = {}
-                     self.registers[parts[0]][i][c] = node.output()
-            else:
-               print("Invalid constant buffer declaration {} (line {})".format(words[1], self.currentLine))
-         else:
-            print("Unsupported constant buffer access pattern {} (line {})".format(words[2], self.currentLine))
-            
-      elif words[0] == "dcl_resource_texture2d":
-         pass
-         # Deal with these during sample_indexable
-         
-      elif words[0] == "dcl_input" or words[0] == "dcl_input_ps":
-         if words[0] == "dcl_input":
-            parts = words[1].split(".")
-         else:
-            parts = words[2].split(".")
+      try:
+         asm = self.tokenizeASM(line)
+      except ValueError as e:
+         print("Unhandled ASM instruction \"{}\" ({})".format(line.strip(), e))
+         return True
+      if asm is None:
+         return True
+      if asm.opcode.startswith("vs_") or asm.opcode.startswith("ps_"):
+         self.shaderVersion = asm.opcode
+         return True
+      declaration = self.declarations.get(asm.opcode)
+      if declaration is not None:
+         return declaration(self, asm.words)
+      
+      spec = self.instructions.get(asm.opcode)
+      if spec is None:
+         print("Unhandled ASM instruction \"{}\" (line {})".format(asm.words[0], self.currentLine))
+         return True
+      handler, arity, componentwise, operation = spec
+      if len(asm.srcs) != arity:
+         print("Instruction \"{}\" expects {} source terms, {} given (line {})".format(asm.opcode, arity, len(asm.srcs), self.currentLine))
+         return True
+      self.instructionLines.add(self.currentLine)
+      if componentwise:
+         self.handleComponentwise(handler, operation, asm.saturate, asm.dest, asm.srcs)
+      else:
+         handler(self, operation, asm.saturate, asm.dest, asm.srcs)
+      return True
+   
+   def handleComponentwise(self, handler, operation, saturate, dest, srcs):
+      """Runs an instruction that works on each component separately, like most arithmetic
+      
+      The handler is called once for each component in the destination mask, with that component of every source term, and returns the RipNodeOutput holding the result.
+      """
+      
+      # prepare for an output for each possible input component
+      outputs = [None] * reduce(lambda a,b: max(len(b), a), srcs, 0)
+      components = dest[1] if dest[1] is not None and len(dest[1]) > 0 else []
+      if len(components) > 1 and any(len(src) != len(outputs) for src in srcs):
+         print("DEBUG: term length mismatch, double-check that selecting the first one is ok (line {})".format(self.currentLine))
+      for cMask in components:
+         # if there's only one output, we don't mask the inputs, we just pick the first one
+         cReal = 0 if len(components) == 1 else cMask
+         outputs[cReal] = handler(self, operation, saturate, [src[cReal] for src in srcs])
+      self.setRegister(dest, outputs)
+   
+   # Declarations, called with the unparsed words of the line
+   
+   def declareRet(self, words):
+      return False
+   
+   def declareNothing(self, words):
+      # dcl_sampler: Different samplers require different handling, but there's no way to automatically detect what
+      # dcl_resource_texture2d: Dealt with during sample_indexable
+      return True
+   
+   def declareGlobalFlags(self, words):
+      self.globalFlags += words[1:]
+      return True
+   
+   def declareConstantBuffer(self, words):
+      if words[2] == "immediateIndexed":
+         parts = words[1].split("[")
          if len(parts) > 1:
-            for c in parts[1]:
-               node = RipNode(self, "Value")
-               node.options['name'] = self.data['input'][parts[0]][c]['name']
-               node.options['label'] = self.data['input'][parts[0]][c]['name']
-               if parts[0] not in self.registers:
-                  self.registers[parts[0]] = {}
-               self.registers[parts[0]][c] = node.output()
+            for i in self.data['resources'][parts[0]]['data']:
+               for c in self.data['resources'][parts[0]]['data'][i]:
+                  node = RipNode(self, "Value")
+                  if parts[0] not in self.registers:
+                     self.registers[parts[0]] = {}
+                  if i not in self.registers[parts[0]]:
+                     self.registers[parts[0]][i] = {}
+                  self.registers[parts[0]][i][c] = node.output()
          else:
-            node = RipNode(self, "Value")
-            self.registers[parts[0]] = node.output()
-            
-      elif words[0] == "dcl_output":
+            print("Invalid constant buffer declaration {} (line {})".format(words[1], self.currentLine))
+      else:
+         print("Unsupported constant buffer access pattern {} (line {})".format(words[2], self.currentLine))
+      return True
+   
+   def declareInput(self, words):
+      if words[0] == "dcl_input":
          parts = words[1].split(".")
-         if len(parts) > 1:
-            for c in parts[1]:
-               if parts[0] not in self.registers:
-                  self.registers[parts[0]] = {}
-               self.registers[parts[0]][c] = None
-         else:
-            self.registers[parts[0]] = None
-            
-      elif words[0] == "dcl_temps":
-         for i in range(int(words[1])):
-            self.registers['r'+str(i)] = {'x':None, 'y':None, 'z':None, 'w':None}
-            
-      elif words[0] == "dcl_indexableTemp":
-         parts = words[1].split("[")
-         if len(parts) > 1 and len(words) == 3:
-            parts[1] = parts[1][:-1]
-            self.registers[parts[0]] = []
-            for i in range(int(parts[1])):
-               self.registers[parts[0]].append({})
-               for c in range(int(words[2])):
-                  self.registers[parts[0]][i]["xyzw"[c]] = None
-         else:
-            print("Invalid indexableTemp declaration {} (line {})".format(words, self.currentLine))
-      
-      elif words[0] == "if" or  words[0] == "if_nz" or  words[0] == "if_z":
-         print("if statements currently unsupported (line {})".format(self.currentLine))
-         self.ignoring = True
-      elif words[0] == "endif":
-         self.ignoring = False
-      
       else:
-         words[0] = self.parseASMInstruction(words[0])
-         words[1] = self.parseASMDest(words[1])
-         for i in range(2, len(words)):
-            words[i] = self.parseASMSrc(words[i])
-            
-         if words[0][0] == "sample_indexable":
-            texnode = RipNode(self, "TexImage")
-            sepnode = RipNode(self, "SeparateRGB")
-            texnode.options['imageData'] = self.data['resources'][words[3][0][1]]['data']
-            texnode.options['name'] = self.data['resources'][words[3][0][1]]['name']
-            texnode.options['label'] = self.data['resources'][words[3][0][1]]['name']
-            texnode.output(0, sepnode.input())
-            if words[3][0][1] not in self.registers:
-               self.registers[words[3][0][1]] = {}
-            self.registers[words[3][0][1]]['x'] = sepnode.output(0)
-            self.registers[words[3][0][1]]['y'] = sepnode.output(1)
-            self.registers[words[3][0][1]]['z'] = sepnode.output(2)
-            self.registers[words[3][0][1]]['w'] = texnode.output(1)
-            uvnode = RipNode(self, "CombineXYZ")
-            uvnode.input(0, self.getOutputFromSrcTerm(words[2][0]))
-            uvnode.input(1, self.getOutputFromSrcTerm(words[2][1]))
-            texnode = self.registers[words[3][0][1]]['w'].node
-            texnode.input(0, uvnode.output())
-            texnode.options['sampler'] = self.data['resources'][words[4][0][1]]
-            self.setRegister(words[1], [self.getRegisterFromTuple(word) for word in words[3]])
-            
-         elif words[0][0] in RipNode.basicMaths:
-            # prepare for an output for each possible input component
-            outputs = [None] * reduce(lambda a,b: max(len(b), a), words[2:], 0)
-            components = words[1][1] if words[1][1] is not None and len(words[1][1]) > 0 else []
-            for cMask in components:
-               # if there's only one output, we don't mask the inputs, we just pick the first one
-               cReal = 0 if len(components) == 1 else cMask
-               node = RipNode(self, "Math")
-               node.options = RipNode.basicMaths[words[0][0]]
-               node.options['use_clamp'] = (words[0][1] & 1 == 1)
-               for i in range(2,len(words)):
-                  if len(words[i]) != len(outputs):
-                     print("DEBUG: term length mismatch, double-check that selecting the first one is ok (line {})".format(self.currentLine))
-                  node.input(i-2, self.getOutputFromSrcTerm(words[i][cReal]))
-               outputs[cReal] = node.output()
-            self.setRegister(words[1], outputs)
-            
-         elif words[0][0] == "exp":
-            # prepare for an output for each possible input component
-            outputs = [None] * len(words[2])
-            components = words[1][1] if words[1][1] is not None and len(words[1][1]) > 0 else []
-            for cMask in components:
-               # if there's only one output, we don't mask the inputs, we just pick the first one
-               cReal = 0 if len(components) == 1 else cMask
-               node = RipNode(self, "Math")
-               node.options['operation'] = "POWER"
-               node.options['use_clamp'] = (words[0][1] & 1 == 1)
-               node.input(0, 2.0)
-               node.input(1, self.getOutputFromSrcTerm(words[2][cReal]))
-               outputs[cReal] = node.output()
-            self.setRegister(words[1], outputs)
-            
-         elif words[0][0] == "log":
-            # prepare for an output for each possible input component
-            outputs = [None] * len(words[2])
-            components = words[1][1] if words[1][1] is not None and len(words[1][1]) > 0 else []
-            for cMask in components:
-               # if there's only one output, we don't mask the inputs, we just pick the first one
-               cReal = 0 if len(components) == 1 else cMask
-               node = RipNode(self, "Math")
-               node.options['operation'] = "LOGARITHM"
-               node.options['use_clamp'] = (words[0][1] & 1 == 1)
-               node.input(0, self.getOutputFromSrcTerm(words[2][cReal]))
-               node.input(1, 2.0)
-               outputs[cReal] = node.output()
-            self.setRegister(words[1], outputs)
-            
-         elif words[0][0] == "ge":
-            # prepare for an output for each possible input component
-            outputs = [None] * max(len(words[2]), len(words[3]))
-            components = words[1][1] if words[1][1] is not None and len(words[1][1]) > 0 else []
-            for cMask in components:
-               # if there's only one output, we don't mask the inputs, we just pick the first one
-               cReal = 0 if len(components) == 1 else cMask
-               node = RipNode(self, "Math")
-               node.options['operation'] = "LESS_THAN"
-               node.options['use_clamp'] = (words[0][1] & 1 == 1)
-               node.input(0, self.getOutputFromSrcTerm(words[3][cReal]))
-               node.input(1, self.getOutputFromSrcTerm(words[2][cReal]))
-               outputs[cReal] = node.output()
-            self.setRegister(words[1], outputs)
-            
-         elif words[0][0] == "and":
-            # prepare for an output for each possible input component
-            outputs = [None] * max(len(words[2]), len(words[3]))
-            components = words[1][1] if words[1][1] is not None and len(words[1][1]) > 0 else []
-            for cMask in components:
-               # if there's only one output, we don't mask the inputs, we just pick the first one
-               cReal = 0 if len(components) == 1 else cMask
-               if float_to_hex(words[3][cReal]) == "0x3f800000":
-                  node = RipNode(self, "Math")
-                  node.options['operation'] = "ADD"
-                  node.options['use_clamp'] = (words[0][1] & 1 == 1)
-                  node.input(0, self.getOutputFromSrcTerm(words[2][cReal]))
-                  node.input(1, 0.0)
-                  outputs[cReal] = node.output()
-               else:
-                  print("unsupported command 'and' only works with specific inputs (line {})".format(self.currentLine))
-            self.setRegister(words[1], outputs)
-            
-         elif words[0][0] == "dp2" or words[0][0] == "dp3" or words[0][0] == "dp4":
-            dimensions = int(words[0][0][2])
-            nodes = []
-            for i in range(dimensions):
-               node = RipNode(self, "Math")
-               node.options['operation'] = "MULTIPLY"
-               node.input(0, self.getOutputFromSrcTerm(words[2][i]))
-               node.input(1, self.getOutputFromSrcTerm(words[3][i]))
-               nodes.append(node)
-            for a in range(dimensions-1):
-               node = RipNode(self, "Math")
-               node.options['operation'] = "ADD"
-               node.input(0, nodes[a].output() if a == 0 else nodes[dimensions-1+a].output())
-               node.input(1, nodes[a+1].output())
-               nodes.append(node)
-            nodes[len(nodes)-1].options['use_clamp'] = (words[0][1] & 1 == 1)
-            self.setRegister(words[1], [nodes[len(nodes)-1].output()])
-            
-         elif words[0][0] == "mov" or words[0][0] == "utof":
-            # prepare for an output for each possible input component
-            outputs = [None] * len(words[2])
-            components = words[1][1] if words[1][1] is not None and len(words[1][1]) > 0 else []
-            for cMask in components:
-               # if there's only one output, we don't mask the inputs, we just pick the first one
-               cReal = 0 if len(components) == 1 else cMask
-               node = RipNode(self, "Math")
-               node.options['operation'] = "ADD"
-               node.options['use_clamp'] = (words[0][1] & 1 == 1)
-               node.input(0, self.getOutputFromSrcTerm(words[2][cReal]))
-               node.input(1, 0.0)
-               outputs[cReal] = node.output()
-            self.setRegister(words[1], outputs)
-            
-         elif words[0][0] == "movc":
-            # prepare for an output for each possible input component
-            outputs = [None] * max(len(words[2]), len(words[3]), len(words[4]))
-            components = words[1][1] if words[1][1] is not None and len(words[1][1]) > 0 else []
-            for cMask in components:
-               # if there's only one output, we don't mask the inputs, we just pick the first one
-               cReal = 0 if len(components) == 1 else cMask
-               compnode = RipNode(self, "Math")
-               compnode.options['operation'] = "COMPARE"
-               compnode.input(0, self.getOutputFromSrcTerm(words[2][cReal]))
-               compnode.input(1, 0.0)
-               compnode.input(2, 0.0)
-               nonode = RipNode(self, "Math")
-               nonode.options['operation'] = "MULTIPLY"
-               nonode.input(0, self.getOutputFromSrcTerm(words[4][cReal]))
-               nonode.input(1, compnode.output())
-               negnode = RipNode(self, "Math")
-               negnode.options['operation'] = "SUBTRACT"
-               negnode.input(0, 1.0)
-               negnode.input(1, compnode.output())
-               yesnode = RipNode(self, "Math")
-               yesnode.options['operation'] = "MULTIPLY"
-               yesnode.input(0, self.getOutputFromSrcTerm(words[3][cReal]))
-               yesnode.input(1, negnode.output())
-               finalnode = RipNode(self, "Math")
-               finalnode.options['operation'] = "ADD"
-               finalnode.options['use_clamp'] = (words[0][1] & 1 == 1)
-               finalnode.input(0, yesnode.output())
-               finalnode.input(1, nonode.output())
-               outputs[cReal] = finalnode.output()
-            self.setRegister(words[1], outputs)
-            
-         elif words[0][0] == "bfi":
-            # prepare for an output for each possible input component
-            outputs = [None] * max(len(words[2]), len(words[3]), len(words[4]), len(words[5]))
-            components = words[1][1] if words[1][1] is not None and len(words[1][1]) > 0 else []
-            for cMask in components:
-               # if there's only one output, we don't mask the inputs, we just pick the first one
-               cReal = 0 if len(components) == 1 else cMask
-               if words[2][cReal] != 28:
-                  print("bfi assumes 28 is first term, but {} given instead. Using 28 anyway... (line {})".format(words[2][cReal], self.currentLine))
-               if type(words[3][cReal]) is not float:
-                  print("bfi currently only supports constants as second term, {} given, result will be incorrect (line {})".format(words[3][cReal], self.currentLine))
-                  words[3][cReal] = 0
-               node = RipNode(self, "Math")
-               node.options['operation'] = "MULTIPLY_ADD"
-               node.options['use_clamp'] = (words[0][1] & 1 == 1)
-               node.input(0, self.getOutputFromSrcTerm(words[4][cReal]))
-               node.input(1, 2**words[3][cReal])
-               node.input(2, self.getOutputFromSrcTerm(words[5][cReal]))
-               outputs[cReal] = node.output()
-            self.setRegister(words[1], outputs)
-            
-         elif words[0][0] == "ne":
-            # prepare for an output for each possible input component
-            outputs = [None] * max(len(words[2]), len(words[3]))
-            components = words[1][1] if words[1][1] is not None and len(words[1][1]) > 0 else []
-            for cMask in components:
-               # if there's only one output, we don't mask the inputs, we just pick the first one
-               cReal = 0 if len(components) == 1 else cMask
-               node1 = RipNode(self, "Math")
-               node1.options['operation'] = "COMPARE"
-               node1.input(0, self.getOutputFromSrcTerm(words[2][cReal]))
-               node1.input(1, self.getOutputFromSrcTerm(words[3][cReal]))
-               node1.input(1, 0.0)
-               node2 = RipNode(self, "Math")
-               node2.options['operation'] = "SUBTRACT"
-               node2.input(0, 1.0)
-               node2.input(1, node1.output())
-               outputs[cReal] = node2.output()
-            self.setRegister(words[1], outputs)
-            
-         else:
-            print("Unhandled ASM instruction \"{}\" (line {})".format(words[0], self.currentLine))
+         parts = words[2].split(".")
+      if len(parts) > 1:
+         for c in parts[1]:
+            node = RipNode(self, "Value")
+            node.options['name'] = self.data['input'][parts[0]][c]['name']
+            node.options['label'] = self.data['input'][parts[0]][c]['name']
+            if parts[0] not in self.registers:
+               self.registers[parts[0]] = {}
+            self.registers[parts[0]][c] = node.output()
+      else:
+         node = RipNode(self, "Value")
+         self.registers[parts[0]] = node.output()
+      return True
+   
+   def declareOutput(self, words):
+      parts = words[1].split(".")
+      if len(parts) > 1:
+         for c in parts[1]:
+            if parts[0] not in self.registers:
+               self.registers[parts[0]] = {}
+            self.registers[parts[0]][c] = None
+      else:
+         self.registers[parts[0]] = None
+      return True
+   
+   def declareTemps(self, words):
+      for i in range(int(words[1])):
+         self.registers['r'+str(i)] = {'x':None, 'y':None, 'z':None, 'w':None}
+      return True
+   
+   def declareIndexableTemp(self, words):
+      parts = words[1].split("[")
+      if len(parts) > 1 and len(words) == 3:
+         parts[1] = parts[1][:-1]
+         self.registers[parts[0]] = []
+         for i in range(int(parts[1])):
+            self.registers[parts[0]].append({})
+            for c in range(int(words[2])):
+               self.registers[parts[0]][i]["xyzw"[c]] = None
+      else:
+         print("Invalid indexableTemp declaration {} (line {})".format(words, self.currentLine))
+      return True
+   
+   def declareIf(self, words):
+      print("if statements currently unsupported (line {})".format(self.currentLine))
+      self.ignoring = True
       return True
    
+   def declareEndIf(self, words):
+      self.ignoring = False
+      return True
+   
+   # Instructions that write whole registers, called with the parsed dest and src terms
+   
+   def instructionSample(self, operation, saturate, dest, srcs):
+      texture = srcs[1][0][1]
+      texnode = RipNode(self, "TexImage")
+      sepnode = RipNode(self, "SeparateRGB")
+      texnode.options['imageData'] = self.data['resources'][texture]['data']
+      texnode.options['name'] = self.data['resources'][texture]['name']
+      texnode.options['label'] = self.data['resources'][texture]['name']
+      texnode.output(0, sepnode.input())
+      if texture not in self.registers:
+         self.registers[texture] = {}
+      self.registers[texture]['x'] = sepnode.output(0)
+      self.registers[texture]['y'] = sepnode.output(1)
+      self.registers[texture]['z'] = sepnode.output(2)
+      self.registers[texture]['w'] = texnode.output(1)
+      uvnode = RipNode(self, "CombineXYZ")
+      uvnode.input(0, self.getOutputFromSrcTerm(srcs[0][0]))
+      uvnode.input(1, self.getOutputFromSrcTerm(srcs[0][1]))
+      texnode.input(0, uvnode.output())
+      texnode.options['sampler'] = self.data['resources'][srcs[2][0][1]]
+      self.setRegister(dest, [self.getRegisterFromTuple(term) for term in srcs[1]])
+   
+   def instructionDot(self, operation, saturate, dest, srcs):
+      dimensions = operation
+      nodes = []
+      for i in range(dimensions):
+         node = RipNode(self, "Math")
+         node.options['operation'] = "MULTIPLY"
+         node.input(0, self.getOutputFromSrcTerm(srcs[0][i]))
+         node.input(1, self.getOutputFromSrcTerm(srcs[1][i]))
+         nodes.append(node)
+      for a in range(dimensions-1):
+         node = RipNode(self, "Math")
+         node.options['operation'] = "ADD"
+         node.input(0, nodes[a].output() if a == 0 else nodes[dimensions-1+a].output())
+         node.input(1, nodes[a+1].output())
+         nodes.append(node)
+      nodes[len(nodes)-1].options['use_clamp'] = (saturate & 1 == 1)
+      self.setRegister(dest, [nodes[len(nodes)-1].output()])
+   
+   # Instructions that work on each component separately, see handleComponentwise
+   
+   def componentMath(self, operation, saturate, terms):
+      node = RipNode(self, "Math")
+      node.options['operation'] = operation
+      node.options['use_clamp'] = (saturate & 1 == 1)
+      for i in range(len(terms)):
+         node.input(i, self.getOutputFromSrcTerm(terms[i]))
+      return node.output()
+   
+   def componentExp(self, operation, saturate, terms):
+      node = RipNode(self, "Math")
+      node.options['operation'] = "POWER"
+      node.options['use_clamp'] = (saturate & 1 == 1)
+      node.input(0, 2.0)
+      node.input(1, self.getOutputFromSrcTerm(terms[0]))
+      return node.output()
+   
+   def componentLog(self, operation, saturate, terms):
+      node = RipNode(self, "Math")
+      node.options['operation'] = "LOGARITHM"
+      node.options['use_clamp'] = (saturate & 1 == 1)
+      node.input(0, self.getOutputFromSrcTerm(terms[0]))
+      node.input(1, 2.0)
+      return node.output()
+   
+   def componentGreaterEqual(self, operation, saturate, terms):
+      node = RipNode(self, "Math")
+      node.options['operation'] = "LESS_THAN"
+      node.options['use_clamp'] = (saturate & 1 == 1)
+      node.input(0, self.getOutputFromSrcTerm(terms[1]))
+      node.input(1, self.getOutputFromSrcTerm(terms[0]))
+      return node.output()
+   
+   def componentAnd(self, operation, saturate, terms):
+      if float_to_hex(terms[1]) == "0x3f800000":
+         return self.componentMove(operation, saturate, terms)
+      print("unsupported command 'and' only works with specific inputs (line {})".format(self.currentLine))
+      return None
+   
+   def componentMove(self, operation, saturate, terms):
+      node = RipNode(self, "Math")
+      node.options['operation'] = "ADD"
+      node.options['use_clamp'] = (saturate & 1 == 1)
+      node.input(0, self.getOutputFromSrcTerm(terms[0]))
+      node.input(1, 0.0)
+      return node.output()
+   
+   def componentMoveConditional(self, operation, saturate, terms):
+      compnode = RipNode(self, "Math")
+      compnode.options['operation'] = "COMPARE"
+      compnode.input(0, self.getOutputFromSrcTerm(terms[0]))
+      compnode.input(1, 0.0)
+      compnode.input(2, 0.0)
+      nonode = RipNode(self, "Math")
+      nonode.options['operation'] = "MULTIPLY"
+      nonode.input(0, self.getOutputFromSrcTerm(terms[2]))
+      nonode.input(1, compnode.output())
+      negnode = RipNode(self, "Math")
+      negnode.options['operation'] = "SUBTRACT"
+      negnode.input(0, 1.0)
+      negnode.input(1, compnode.output())
+      yesnode = RipNode(self, "Math")
+      yesnode.options['operation'] = "MULTIPLY"
+      yesnode.input(0, self.getOutputFromSrcTerm(terms[1]))
+      yesnode.input(1, negnode.output())
+      finalnode = RipNode(self, "Math")
+      finalnode.options['operation'] = "ADD"
+      finalnode.options['use_clamp'] = (saturate & 1 == 1)
+      finalnode.input(0, yesnode.output())
+      finalnode.input(1, nonode.output())
+      return finalnode.output()
+   
+   def componentBitfieldInsert(self, operation, saturate, terms):
+      if terms[0] != 28:
+         print("bfi assumes 28 is first term, but {} given instead. Using 28 anyway... (line {})".format(terms[0], self.currentLine))
+      shift = terms[1]
+      if type(shift) is not float:
+         print("bfi currently only supports constants as second term, {} given, result will be incorrect (line {})".format(shift, self.currentLine))
+         shift = 0
+      node = RipNode(self, "Math")
+      node.options['operation'] = "MULTIPLY_ADD"
+      node.options['use_clamp'] = (saturate & 1 == 1)
+      node.input(0, self.getOutputFromSrcTerm(terms[2]))
+      node.input(1, 2**shift)
+      node.input(2, self.getOutputFromSrcTerm(terms[3]))
+      return node.output()
+   
+   def componentNotEqual(self, operation, saturate, terms):
+      node1 = RipNode(self, "Math")
+      node1.options['operation'] = "COMPARE"
+      node1.input(0, self.getOutputFromSrcTerm(terms[0]))
+      node1.input(1, self.getOutputFromSrcTerm(terms[1]))
+      node1.input(2, 0.0)
+      node2 = RipNode(self, "Math")
+      node2.options['operation'] = "SUBTRACT"
+      node2.input(0, 1.0)
+      node2.input(1, node1.output())
+      return node2.output()
+   
+   # opcode: handler, called with the unparsed words of the line, returning False at the end of the shader
+   declarations = {
+      'ret': declareRet,
+      'dcl_sampler': declareNothing,
+      'dcl_resource_texture2d': declareNothing,
+      'dcl_globalFlags': declareGlobalFlags,
+      'dcl_constantbuffer': declareConstantBuffer,
+      'dcl_input': declareInput,
+      'dcl_input_ps': declareInput,
+      'dcl_output': declareOutput,
+      'dcl_temps': declareTemps,
+      'dcl_indexableTemp': declareIndexableTemp,
+      'if': declareIf,
+      'if_nz': declareIf,
+      'if_z': declareIf,
+      'endif': declareEndIf,
+   }
+   
+   # opcode (without _sat): (handler, number of src terms, whether the handler is called per component, extra argument for the handler)
+   instructions = {
+      'add': (componentMath, 2, True, "ADD"),
+      'div': (componentMath, 2, True, "DIVIDE"),
+      'frc': (componentMath, 1, True, "FRACT"),
+      'lt': (componentMath, 2, True, "LESS_THAN"),
+      'mad': (componentMath, 3, True, "MULTIPLY_ADD"),
+      'max': (componentMath, 2, True, "MAXIMUM"),
+      'min': (componentMath, 2, True, "MINIMUM"),
+      'mul': (componentMath, 2, True, "MULTIPLY"),
+      'round_ne': (componentMath, 1, True, "ROUND"),
+      'round_ni': (componentMath, 1, True, "FLOOR"),
+      'round_pi': (componentMath, 1, True, "CEIL"),
+      'round_z': (componentMath, 1, True, "TRUNC"),
+      'rsq': (componentMath, 1, True, "INVERSE_SQRT"),
+      'sqrt': (componentMath, 1, True, "SQRT"),
+      'exp': (componentExp, 1, True, None),
+      'log': (componentLog, 1, True, None),
+      'ge': (componentGreaterEqual, 2, True, None),
+      'and': (componentAnd, 2, True, None),
+      'mov': (componentMove, 1, True, None),
+      'utof': (componentMove, 1, True, None),
+      'movc': (componentMoveConditional, 3, True, None),
+      'bfi': (componentBitfieldInsert, 4, True, None),
+      'ne': (componentNotEqual, 2, True, None),
+      'dp2': (instructionDot, 2, False, 2),
+      'dp3': (instructionDot, 2, False, 3),
+      'dp4': (instructionDot, 2, False, 4),
+      'sample_indexable': (instructionSample, 3, False, None),
+   }
+   
+   def tokenizeASM(self, line):
+      """Splits a line of HLSL ASM into its opcode and terms, parsing the dest and src terms of instructions along the way
+      
+      Parameters
+      ----------
+      line : str
+         the ASM instruction line
+      
+      Returns
+      -------
+      RipASMLine or None
+         the tokenized line, or None if the line is empty
+      """
+      
+      words = self.parseASM(line)
+      if len(words) == 0:
+         return None
+      if words[0] in self.declarations or words[0].startswith("vs_") or words[0].startswith("ps_"):
+         return RipASMLine(words, words[0], 0, None, None)
+      opcode, saturate = self.parseASMInstruction(words[0])
+      # The terms of lines that aren't handled might not even be operands, like the rows of dcl_immediateConstantBuffer
+      if len(words) < 2 or opcode not in self.instructions:
+         return RipASMLine(words, opcode, saturate, None, ())
+      srcTerms = self.srcTerms
+      srcs = [srcTerms.get(word) if type(word) is str else None for word in words[2:]]
+      for i in range(len(srcs)):
+         if srcs[i] is None:
+            srcs[i] = self.parseASMSrc(words[i+2])
+      return RipASMLine(words, opcode, saturate, self.parseASMDest(words[1]), srcs)
+   
    def parseASM(self, line):
       """Parses a line of HLSL ASM into something this script can understand
       
@@ -469,47 +556,10 @@ class RipShader:
       Returns
       -------
       list
-         the ASM instruction split by terms
+         the ASM instruction split by terms, with each number list like l(1.0, 0, 0, 0) as a list of the numbers as str
       """
       
-      result = []
-      subresult = []
-      bStart = 0
-      parins = 0
-      isNumeric = False
-      for c in range(len(line)):
-         # If we aren't inside a parinthetical, then spaces, commas, and new-lines are word separators.
-         if parins == 0 and (line[c] == " " or line[c] == "," or line[c] == "\n"):
-            # Skip consecutive word separators (empty words)
-            if c > bStart:
-               result.append(line[bStart:c])
-            bStart = c+1
-            isNumeric = False
-         # If we aren't inside a parinthetical, then "l" followed by "(" means we are about to read a list of numbers.
-         elif parins == 0 and bStart == c and line[c] == "l" and line[c+1] == "(":
-            bStart = c+1
-            isNumeric = True
-         elif line[c] == "(":
-            parins += 1
-            # We only really care if this is a list of numbers, otherwise treat this like any other word.
-            if isNumeric:
-               bStart = c+1
-         # If we are inside a parinthetical, spaces, commas, and closing parins are separators.
-         elif parins > 0 and (line[c] == " " or line[c] == "," or line[c] == ")"):
-            if line[c] == ")":
-               parins -= 1
-            # We only really care if this is a list of numbers, otherwise treat this like any other word.
-            if isNumeric:
-               if c > bStart:
-                  subresult.append(line[bStart:c])
-               if line[c] == ")":
-                  result.append(subresult)
-                  subresult = []
-               bStart = c+1
-      # Just in case the line didn't end with a new-line
-      if len(line) > bStart:
-         result.append(line[bStart:])
-      return result
+      return [word or self.numberRegEx.findall(numbers) for numbers, word in self.tokenRegEx.findall(line)]
    
    def parseASMInstruction(self, term):
       """Parses an ASM instruction name into something this script can understand
@@ -527,11 +577,11 @@ class RipShader:
             int, bitwise, modifiers of the instruction: 1=saturate
       """
       
-      instruction = term.split("(")
-      if instruction[0].endswith("_sat"):
-         return (instruction[0][:-4], 1)
+      instruction = term.split("(", 1)[0]
+      if instruction.endswith("_sat"):
+         return (instruction[:-4], 1)
       else:
-         return (instruction[0], 0)
+         return (instruction, 0)
    
    def parseASMDest(self, term):
       """Parses a dest term of an ASM instruction into something this script can understand
@@ -545,55 +595,39 @@ class RipShader:
       -------
       tuple
          a tuple with two elements:
-            str or list[2], the destination register
+            str or tuple[2], the destination register
                if str, its a normal register and this is the name
-               if list[2], it's a indexed register, first element is the name, second is the index
-            list, indexes of the destination components as given by the mask, or None if there was no mask
+               if tuple[2], it's a indexed register, first element is the name, second is the index
+            tuple, indexes of the destination components as given by the mask, or None if there was no mask
       """
       
-      termParts = term.split(".")
-      destParts = termParts[0].split("[")
-      if len(destParts) > 1:
-         destParts[1] = destParts[1][:-1]
-         dest = destParts
-      else:
-         dest = termParts[0]
-      if len(termParts) > 1:
-         mask = []
+      result = self.destTerms.get(term)
+      if result is None:
+         match = self.operandRegEx.fullmatch(term)
+         if match is None:
+            raise ValueError("Invalid dest term '{}' (line {})".format(term, self.currentLine))
+         name, index, mask = match.group(3, 4, 5)
+         dest = name if index is None else (name, index)
          # Masks should always be in order, so we only need to check if a component exists.
-         if termParts[1].find("x") > -1:
-            mask.append(0)
-         if termParts[1].find("y") > -1:
-            mask.append(1)
-         if termParts[1].find("z") > -1:
-            mask.append(2)
-         if termParts[1].find("w") > -1:
-            mask.append(3)
-      else:
-         mask = None
-      return (dest, mask)
-
+         result = self.destTerms[term] = (dest, None if mask is None else tuple(c for c in range(4) if "xyzw"[c] in mask))
+      return result
+   
    def parseASMSrc(self, term):
       """Parses a src term of an ASM instruction into something this script can understand
       
       Parameters
       ----------
-      term : str
-         a term of the ASM instruction
+      term : str or list[str]
+         a term of the ASM instruction, as returned by parseASM
       
       Returns
       -------
-      list
-         a list of components to be used by the instruction, each element either a float or a tuple (see parseASMSwizzle)
+      tuple
+         the components to be used by the instruction, each element either a float or a tuple (see parseASMSwizzle)
       """
       
       if type(term) is list:
-         for w in range(len(term)):
-            if term[w].startswith("0x"):
-               term[w] = struct.unpack('<f', struct.pack('<I', int(term[w], 0)))[0]
-            else:
-               term[w] = float(term[w])
-         return term
+         return tuple(struct.unpack('<f', struct.pack('<I', int(number, 0)))[0] if number.startswith("0x") else float(number) for number in term)
       else:
          return self.parseASMSwizzle(term)
    
@@ -607,38 +641,29 @@ class RipShader:
       
       Returns
       -------
-      list
-         a list of tuples, each with the following three elements:
+      tuple
+         a tuple of tuples, each with the following three elements:
             int, bitwise, representing whether the term had negative or absolute value symbols: 1=negative, 2=absolute
-            str or list[2], the source register
+            str or tuple[2], the source register
                if str, its a normal register and this is the name
-               if list[2], it's a indexed register, first element is the name, second is the index
+               if tuple[2], it's a indexed register, first element is the name, second is the index
             str, one of the components of this swizzle, or None if there was no swizzle
       """
       
-      mod = 0
-      if term.startswith("-"):
-         mod += 1
-         term = term[1:]
-      if term.startswith("|"):
-         mod += 2
-         term = term[1:-1]
-      termParts = term.split(".")
-      srcParts = termParts[0].split("[")
-      if len(srcParts) > 1:
-         srcParts[1] = srcParts[1][:-1]
-      if len(termParts) > 1:
-         result = []
-         for n in termParts[1]:
-            if len(srcParts) > 1:
-               result.append((mod, srcParts, n))
-            else:
-               result.append((mod, termParts[0], n))
-         return result
-      elif len(srcParts) > 1:
-         return [(mod, srcParts, None)]
-      else:
-         return [(mod, termParts[0], None)]
+      result = self.srcTerms.get(term)
+      if result is None:
+         match = self.operandRegEx.fullmatch(term)
+         if match is None:
+            raise ValueError("Invalid src term '{}' (line {})".format(term, self.currentLine))
+         negative, absolute, name, index, swizzle = match.groups()
+         mod = (1 if negative else 0) + (2 if absolute else 0)
+         src = name if index is None else (name, index)
+         if swizzle is None:
+            result = ((mod, src, None),)
+         else:
+            result = tuple((mod, src, n) for n in swizzle)
+         self.srcTerms[term] = result
+      return result
    
    def getRegisterFromTuple(self, term):
       """Gets the register referred to by the given tuple parsed by parseASMSwizzle
@@ -655,7 +680,7 @@ class RipShader:
       """
       
       if(type(term) is tuple and len(term) == 3):
-         if type(term[1]) is list:
+         if type(term[1]) is tuple:
             return self.registers[term[1][0]][term[1][1]][term[2]]
          else:
             return self.registers[term[1]][term[2]]
@@ -669,6 +694,7 @@ class RipShader:
             negnode = RipNode(self, "Math")
             negnode.options['operation'] = "MULTIPLY"
             negnode.input(0, reg)
+            negnode.input(1, -1.0)
             reg = negnode.output()
          if term[0] & 2 == 2:
             absnode = RipNode(self, "Math")
@@ -684,12 +710,12 @@ class RipShader:
    
    def setRegister(self, dest, nodeOutputs):
       if dest[1] is None:
-         if type(dest[0]) is list:
+         if type(dest[0]) is tuple:
             self.registers[dest[0][0]][dest[0][1]] = nodeOutputs[0]
          else:
             self.registers[dest[0]] = nodeOutputs[0]
       else:
-         if type(dest[0]) is list:
+         if type(dest[0]) is tuple:
             target = self.registers[dest[0][0]][dest[0][1]]
          else:
             target = self.registers[dest[0]]
@@ -701,6 +727,253 @@ class RipShader:
          else:
             raise ValueError("Destination components somehow empty (line {})".format(self.currentLine))
    
+   def optimize(self):
+      """Shrinks the RipNode graph without changing what the output registers compute
+      
+      Walking the nodes in dependency order, this folds Math nodes whose inputs are all constants, forwards the inputs of nodes that just copy them (like the ADD 0 that mov becomes), and merges nodes that do the same thing to the same inputs. Afterwards, only nodes that an output register depends on are kept.
+      
+      Returns
+      -------
+      int
+         how many nodes were removed
+      """
+      
+      before = len(self.nodes)
+      # Dropping the dead nodes first saves looking at them
+      self.prune()
+      registers = self.outputRegisters()
+      known = {}
+      for node in self.dependencyOrder(self.outputNodes()):
+         if node.type == "Math" and self.foldNode(node, registers):
+            continue
+         source = node.identitySource()
+         if source is not None:
+            self.replaceOutput(node.output(0), source, registers)
+            continue
+         # Nodes without inputs are the values of different registers, even if they look alike
+         if len(node.inputs) == 0:
+            continue
+         key = node.signature()
+         if key in known:
+            for id in list(node.outputs):
+               self.replaceOutput(node.outputs[id], known[key].output(id), registers)
+         else:
+            known[key] = node
+      self.prune()
+      return before - len(self.nodes)
+   
+   def foldNode(self, node, registers):
+      """Replaces the output of a Math node by its value, if all of its inputs are constants
+      
+      Returns
+      -------
+      bool
+         whether the node was folded
+      """
+      
+      fold = RipNode.mathFolds.get(node.options.get('operation'))
+      if fold is None:
+         return False
+      arity, function = fold
+      values = []
+      for id in range(arity):
+         input = node.inputs.get(id)
+         if input is not None and input.connection is not None:
+            return False
+         values.append(input.defaultValue if input is not None else 0.5)
+      try:
+         value = float(function(*values))
+      except (ArithmeticError, ValueError):
+         # Blender's Math node returns 0 where Python would raise, like dividing by 0
+         value = 0.0
+      if node.options.get('use_clamp'):
+         value = min(max(value, 0.0), 1.0)
+      self.replaceOutput(node.output(0), value, registers)
+      return True
+   
+   def replaceOutput(self, output, source, registers):
+      """Points everything that uses a node output at something else instead
+      
+      Parameters
+      ----------
+      output : RipNodeOutput
+         the output to replace
+      source : RipNodeOutput or float
+         what to use instead; a float becomes the default value of the inputs it replaces, but only for nodes with plain number inputs, and never for output registers, which need a node to link
+      registers : list[tuple]
+         the output registers, from outputRegisters
+      """
+      
+      for input in list(output.connections):
+         if type(source) is float:
+            if input.node.type not in RipNode.scalarInputTypes:
+               continue
+            input.disconnect()
+            input.defaultValue = source
+         else:
+            input.disconnect()
+            input.connect(source)
+      if type(source) is not float:
+         for container, key in registers:
+            if container[key] is output:
+               container[key] = source
+   
+   def outputRegisters(self):
+      """Lists where the output registers (o0, o1, ...) are stored in self.registers
+      
+      Returns
+      -------
+      list[tuple]
+         (dict, key) pairs, such that dict[key] is a RipNodeOutput or None
+      """
+      
+      result = []
+      for reg in self.registers:
+         if reg.startswith("o"):
+            if type(self.registers[reg]) is dict:
+               for c in self.registers[reg]:
+                  result.append((self.registers[reg], c))
+            else:
+               result.append((self.registers, reg))
+      return result
+   
+   def outputNodes(self):
+      """Gets the nodes that the output registers are connected to
+      """
+      
+      return [container[key].node for container, key in self.outputRegisters() if container[key] is not None]
+   
+   def dependencyOrder(self, roots):
+      """Walks the graph back from the given nodes through their input connections, without recursion
+      
+      Each node and connection is looked at once, so this stays fast and within the stack limit on the longest dependency chains.
+      
+      Parameters
+      ----------
+      roots : list[RipNode]
+         where to start
+      
+      Returns
+      -------
+      list[RipNode]
+         every node the roots depend on, including the roots, each after all of the nodes it depends on
+      
+      Raises
+      ------
+      ValueError
+         if the graph has a cycle, which RipShader never creates on purpose
+      """
+      
+      order = []
+      # node -> 1 while the nodes it depends on are being walked, 2 once it is in order
+      state = {}
+      for root in roots:
+         if root in state:
+            continue
+         state[root] = 1
+         stack = [(root, iter(root.inputs.values()))]
+         while len(stack) > 0:
+            node, inputs = stack[-1]
+            for input in inputs:
+               if input.connection is None:
+                  continue
+               source = input.connection.node
+               mark = state.get(source)
+               if mark is None:
+                  state[source] = 1
+                  stack.append((source, iter(source.inputs.values())))
+                  break
+               elif mark == 1:
+                  raise ValueError("Node graph of {} has a cycle through {}".format(self.fileName, source))
+            else:
+               stack.pop()
+               state[node] = 2
+               order.append(node)
+      return order
+   
+   def liveNodes(self):
+      """Finds the nodes that an output register depends on, following the input connections back from the output registers
+      
+      Returns
+      -------
+      list[RipNode]
+         those nodes, in the same order as self.nodes
+      """
+      
+      live = set(self.dependencyOrder(self.outputNodes()))
+      return [node for node in self.nodes if node in live]
+   
+   def prune(self):
+      """Removes the nodes that no output register depends on, disconnecting them from the rest
+      """
+      
+      live = set(self.liveNodes())
+      for node in self.nodes:
+         if node not in live:
+            for id in node.inputs:
+               node.inputs[id].disconnect()
+      self.nodes = [node for node in self.nodes if node in live]
+   
+   def layout(self):
+      """Arranges the live nodes in columns for display, with the outputs on the right
+      
+      Each node goes one column left of the leftmost node that uses it, so every link points to the right. Within a column, nodes are sorted by the average row of the nodes that use them, which keeps most links short and uncrossed.
+      
+      Returns
+      -------
+      dict
+         RipNode -> (column, row), column 0 holding the nodes the output registers are connected to
+      """
+      
+      roots = self.outputNodes()
+      order = self.dependencyOrder(roots)
+      column = {}
+      consumers = {}
+      # Reversed, every node comes after all of the live nodes that use it
+      for node in reversed(order):
+         column.setdefault(node, 0)
+         for id in node.inputs:
+            if node.inputs[id].connection is not None:
+               source = node.inputs[id].connection.node
+               column[source] = max(column.get(source, 0), column[node] + 1)
+               consumers.setdefault(source, []).append(node)
+      columns = {}
+      for node in order:
+         columns.setdefault(column[node], []).append(node)
+      
+      result = {}
+      # The first column follows the order of the output registers
+      rootOrder = {}
+      for node in roots:
+         rootOrder.setdefault(node, len(rootOrder))
+      for c in sorted(columns):
+         if c == 0:
+            nodes = sorted(columns[c], key=lambda node: rootOrder.get(node, len(rootOrder)))
+         else:
+            nodes = sorted(columns[c], key=lambda node: sum(result[user][1] for user in consumers[node]) / len(consumers[node]))
+         for row in range(len(nodes)):
+            result[nodes[row]] = (c, row)
+      return result
+   
+   def findDeadInstructions(self):
+      """Finds the instructions that none of the outputs depend on
+      
+      Returns
+      -------
+      list[int]
+         the line numbers of the instructions whose nodes are all dead (see liveNodes)
+      """
+      
+      liveLines = set(node.createdLine for node in self.liveNodes())
+      return sorted(set(node.createdLine for node in self.nodes if node.createdLine in self.instructionLines and node.createdLine not in liveLines))
+   
+   def resetBuildState(self):
+      """Forgets the Blender nodes made from this shader's RipNodes, so the same parsed shader can be built into another material
+      """
+      
+      for node in self.nodes:
+         node.blenderNode = None
+   
    def __str__(self) -> str:
       result = []
       result.append("--- Begin str(RipShader) ---")
@@ -713,25 +986,86 @@ class RipShader:
       result.append("---  End str(RipShader)  ---")
       return "\n".join(result)
 
+class RipASMLine:
+   """One tokenized line of HLSL ASM, made by RipShader.tokenizeASM
+   
+   Declarations only have their words. Instructions also have their dest term parsed by RipShader.parseASMDest and their src terms parsed by RipShader.parseASMSrc.
+   """
+   
+   __slots__ = ('words', 'opcode', 'saturate', 'dest', 'srcs')
+   
+   def __init__(self, words, opcode, saturate, dest, srcs):
+      self.words = words
+      self.opcode = opcode
+      self.saturate = saturate
+      self.dest = dest
+      self.srcs = srcs
+
+class RipShaderRegistry:
+   """Shares RipShader objects between RipFiles, so each shader is parsed at most once per import
+   
+   Shaders are keyed on their file path and on the textures bound to them, since the texture list decides what the texture resources of a shader refer to.
+   """
+   
+   def __init__(self):
+      self.shaders = {}
+      self.hits = 0
+      self.misses = 0
+   
+   def get(self, fileDir, fileName, textures):
+      """Gets the RipShader for a shader file and texture list, creating it the first time
+      
+      Returns
+      -------
+      RipShader
+         the shared shader, which might already be parsed
+      """
+      
+      key = (os.path.normcase(os.path.normpath(os.path.join(fileDir, fileName))), tuple(texture['filePath'] for texture in textures))
+      shader = self.shaders.get(key)
+      if shader is None:
+         shader = self.shaders[key] = RipShader(fileDir, fileName, textures)
+         self.misses += 1
+      else:
+         self.hits += 1
+      return shader
+
 class RipNode:
    """Corresponds to a node in a Blender material, but without any references to the Blender API
    """
    
-   basicMaths = {
-      'add': {'operation':"ADD"},
-      'div': {'operation':"DIVIDE"},
-      'frc': {'operation':"FRACT"},
-      'lt': {'operation':"LESS_THAN"},
-      'mad': {'operation':"MULTIPLY_ADD"},
-      'max': {'operation':"MAXIMUM"},
-      'min': {'operation':"MINIMUM"},
-      'mul': {'operation':"MULTIPLY"},
-      'round_ne': {'operation':"ROUND"},
-      'round_ni': {'operation':"FLOOR"},
-      'round_pi': {'operation':"CEIL"},
-      'round_z': {'operation':"TRUNC"},
-      'rsq': {'operation':"INVERSE_SQRT"},
-      'sqrt': {'operation':"SQRT"},
+   # Node types whose inputs are plain numbers, so a constant can stand in for a link
+   scalarInputTypes = {"Math", "CombineXYZ", "CombineRGB"}
+   
+   # Math operation: (number of inputs, how to calculate it), for constant folding. These follow Blender's Math node, which returns 0 instead of failing.
+   mathFolds = {
+      'ADD': (2, lambda a, b: a + b),
+      'SUBTRACT': (2, lambda a, b: a - b),
+      'MULTIPLY': (2, lambda a, b: a * b),
+      'DIVIDE': (2, lambda a, b: a / b),
+      'MULTIPLY_ADD': (3, lambda a, b, c: a * b + c),
+      'POWER': (2, lambda a, b: a ** b if a >= 0 or b == math.floor(b) else 0.0),
+      'LOGARITHM': (2, lambda a, b: math.log(a) / math.log(b) if a > 0 and b > 0 else 0.0),
+      'SQRT': (1, lambda a: math.sqrt(a) if a > 0 else 0.0),
+      'INVERSE_SQRT': (1, lambda a: 1 / math.sqrt(a) if a > 0 else 0.0),
+      'ABSOLUTE': (1, abs),
+      'MINIMUM': (2, min),
+      'MAXIMUM': (2, max),
+      'LESS_THAN': (2, lambda a, b: 1.0 if a < b else 0.0),
+      'COMPARE': (3, lambda a, b, c: 1.0 if abs(a - b) <= max(c, 1.1920929e-07) else 0.0),
+      'FRACT': (1, lambda a: a - math.floor(a)),
+      'FLOOR': (1, math.floor),
+      'CEIL': (1, math.ceil),
+      'TRUNC': (1, math.trunc),
+      'ROUND': (1, lambda a: math.floor(a + 0.5)),
+   }
+   
+   # Math operation: (the input that passes through, the input id and value that make the node do nothing else)
+   mathIdentities = {
+      'ADD': (0, 1, 0.0),
+      'SUBTRACT': (0, 1, 0.0),
+      'MULTIPLY': (0, 1, 1.0),
+      'DIVIDE': (0, 1, 1.0),
    }
    
    def __init__(self, shader, type):
@@ -743,21 +1077,53 @@ class RipNode:
       self.options = {}
       self.shader.nodes.append(self)
       self.blenderNode = None
-      self.handled = False
-   
-   def traverse(self, prev=None):
-      if not self.handled:
-         for id in self.inputs:
-            print("Handling input #{} of {}".format(id, self))
-            if self.inputs[id].connection is not None:
-               if self.inputs[id].handled:
-                  print("ERROR: Infinite recursion detected!")
-               else:
-                  self.inputs[id].handled = True
-                  self.inputs[id].connection.node.traverse(self)
+   
+   def traverse(self):
+      """Prints this node and every node it depends on, dependencies first, for debugging
+      """
+      
+      for node in self.shader.dependencyOrder([self]):
+         print(node)
+         for id in node.inputs:
+            if node.inputs[id].connection is not None:
+               print("  input #{}: {}".format(id, node.inputs[id].connection))
             else:
-               print("Value: ".format(self.inputs[id].defaultValue))
-         self.handled = True
+               print("  input #{}: {}".format(id, node.inputs[id].defaultValue))
+   
+   def identitySource(self):
+      """Checks whether this node only passes one of its inputs through, like the ADD 0 made for mov
+      
+      Returns
+      -------
+      RipNodeOutput or None
+         the output connected to the input that passes through, or None if this node does more than that
+      """
+      
+      if self.type != "Math" or self.options.get('use_clamp'):
+         return None
+      identity = RipNode.mathIdentities.get(self.options.get('operation'))
+      if identity is None:
+         return None
+      source, id, value = identity
+      if source not in self.inputs or self.inputs[source].connection is None:
+         return None
+      if id not in self.inputs or self.inputs[id].connection is not None or self.inputs[id].defaultValue != value:
+         return None
+      return self.inputs[source].connection
+   
+   def signature(self):
+      """Gets a key that is the same for two nodes exactly when they calculate the same thing
+      """
+      
+      options = tuple(sorted((name, id(value) if type(value) is dict else value) for name, value in self.options.items()))
+      inputs = []
+      for inputId in sorted(self.inputs, key=str):
+         input = self.inputs[inputId]
+         if input.connection is not None:
+            inputs.append((inputId, input.connection.node, input.connection.id))
+         else:
+            inputs.append((inputId, None, input.defaultValue))
+      return (self.type, options, tuple(inputs))
    
    def input(self, id=0, connect=None):
       if id not in self.inputs:
@@ -808,7 +1174,6 @@ class RipNodeInput:
       self.id = id
       self.connection = None
       self.defaultValue = 0.5
-      self.handled = False # for use by RipMesh
    
    def connect(self, output, oneWay=False):
       if isinstance(output, RipNodeOutput):
@@ -822,6 +1187,12 @@ class RipNodeInput:
          raise TypeError("Tried to connect something other than a RipNodeOutput ({}) to a RipNodeInput (line {})".format(type(output), self.node.shader.currentLine))
       return self
    
+   def disconnect(self):
+      if self.connection is not None:
+         self.connection.connections.remove(self)
+         self.connection = None
+      return self
+   
    def __repr__(self):
       return str(self)
    
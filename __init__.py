@@ -9,10 +9,17 @@ bl_info = {
 
 import bpy
 import os
+import time
+import traceback
 from bpy.props import BoolProperty, FloatProperty, StringProperty, EnumProperty
 from bpy_extras.io_utils import ImportHelper
 from .RipFile import RipFile
-from .RipMesh import RipMesh
+from .RipMesh import RipMesh, RipMaterial, RipTextureRegistry
+from . import RipPool
+from .RipCache import RipCache
+from .RipManifest import RipManifest
+from .RipShader import RipShaderRegistry
+from . import RipProfile
 
 class ImportRIP(bpy.types.Operator, ImportHelper):
    bl_idname = "import_scene.rip"
@@ -20,6 +27,12 @@ class ImportRIP(bpy.types.Operator, ImportHelper):
    bl_options = {'UNDO'}
    filename_ext = ".rip"
    
+   # How often the background import gets to run, and for how long each time, in seconds
+   timerInterval = 0.02
+   timeSlice = 0.1
+   # The ImportRIP running in the background, if any
+   backgroundImport = None
+   
    filter_glob: StringProperty(default="*.rip", options={'HIDDEN'}, maxlen=255)
    xyzOrder: bpy.props.EnumProperty(items=(('Xzy', '-X, Z, Y', '-X, Z, Y'),
                                            ('xyz', 'X, Y, Z',  'X, Y, Z')), name="Vertex Order")
@@ -28,11 +41,21 @@ class ImportRIP(bpy.types.Operator, ImportHelper):
    scale: FloatProperty(name="Scale", default=1.0)
    reuseMats: BoolProperty(name="Re-use materials", description="Re-use existing materials from other RIP files", default=True)
    importAll: BoolProperty(name="Import entire folder", description="Import all meshes in this folder", default=False)
+   incremental: BoolProperty(name="Only import new files", description="When importing an entire folder, leave out the files that the folder's manifest says were already imported or skipped, and haven't changed since", default=False)
    importShaders: BoolProperty(name="Import shaders", description="Import shader files into materials (SEE INSTRUCTIONS BEFORE YOU DO THIS)", default=False)
    keep2D: BoolProperty(name="Keep 2D meshes", description="Keep meshes that are not three-dimensional", default=False)
    keepUntextured: BoolProperty(name="Keep untextured meshes", description="Keep meshes that have no textures associated with them", default=False)
-   removeDuplicates: BoolProperty(name="Remove duplicate meshes", description="EXPERIMENTAL. Attempts to remove meshes that *seem* to be the same, keeping the one with more textures", default=False)
-
+   removeDuplicates: BoolProperty(name="Remove duplicate meshes", description="EXPERIMENTAL. Removes meshes with the same vertex positions and faces as another mesh, keeping the one with more textures", default=False)
+   instanceMeshes: BoolProperty(name="Instance repeated meshes", description="Meshes with exactly the same vertices and faces as another mesh share one mesh datablock, only differing in material", default=True)
+   asyncImport: BoolProperty(name="Import in the background", description="Keep Blender responsive during the import, showing its progress on the cursor. Press Esc to cancel it", default=False)
+   memoryMap: BoolProperty(name="Memory-map files", description="Read RIP files through a memory map instead of copying them into memory", default=True)
+   parallelParse: BoolProperty(name="Parallel parsing", description="Parse RIP files in separate processes, using all CPU cores", default=True)
+   useCache: BoolProperty(name="Cache parsed files", description="Keep parsed RIP files in a cache on disk, so importing them again is faster", default=True)
+   profiling: EnumProperty(items=(('NONE', 'Off', 'Only print a summary of where the time went'),
+                                  ('TIMING', 'Timing', 'Write a timing report next to the RIP files'),
+                                  ('CPROFILE', 'Timing + calls', 'Also profile every function call (slower import)'),
+                                  ('MEMORY', 'Timing + memory', 'Also trace memory allocations (slower import)')), name="Profiling", description="Write a report of where the import spends its time, which chrome://tracing or Perfetto can open")
+   
    def draw(self, context):
       layout = self.layout
       sub = layout.row()
@@ -46,6 +69,8 @@ class ImportRIP(bpy.types.Operator, ImportHelper):
       sub = layout.row()
       sub.prop(self, "importAll")
       sub = layout.row()
+      sub.prop(self, "incremental")
+      sub = layout.row()
       sub.prop(self, "importShaders")
       sub = layout.row()
       sub.prop(self, "keep2D")
@@ -53,42 +78,215 @@ class ImportRIP(bpy.types.Operator, ImportHelper):
       sub.prop(self, "keepUntextured")
       sub = layout.row()
       sub.prop(self, "removeDuplicates")
-
+      sub = layout.row()
+      sub.prop(self, "instanceMeshes")
+      sub = layout.row()
+      sub.prop(self, "memoryMap")
+      sub = layout.row()
+      sub.prop(self, "parallelParse")
+      sub = layout.row()
+      sub.prop(self, "useCache")
+      sub = layout.row()
+      sub.prop(self, "profiling")
+      sub = layout.row()
+      sub.prop(self, "asyncImport")
+   
    def execute(self, context):
-      ripFiles = [RipFile(self.filepath)]
-      if self.importAll:
-         for file in os.listdir(ripFiles[0].fileDir):
-            if file != ripFiles[0].fileName and file.lower().endswith(".rip"):
-               ripFiles.append(RipFile(os.path.join(ripFiles[0].fileDir, file)))
-               
-      for rip in ripFiles:
-         rip.parse(xyzOrder=self.xyzOrder, uvOrder=self.uvOrder, scale=self.scale, keep2D=self.keep2D, keepUntextured=self.keepUntextured)
-      numBefore = len(ripFiles)
-      ripFiles = list(filter(lambda r: r.parsed, ripFiles))
-      print("Total RIP files skipped: {}".format(numBefore - len(ripFiles)))
-      
-      if self.removeDuplicates:
-         ripFilesFinal = []
-         for rip in ripFiles:
-            add = True
-            for r in range(len(ripFilesFinal)):
-               if rip.seemsEqual(ripFilesFinal[r]):
-                  # TODO: If some of the first rips we find duplicates for have equal texture counts, the duplicates will be kept. If later, a duplicate rip with more textures comes along, only the first duplicate rip will be overwritten, and the other duplicate(s) will still remain.
-                  add = False
-                  if len(rip.textures) > len(ripFilesFinal[r].textures):
-                     ripFilesFinal[r] = rip
-                  break
-            if add:
-               ripFilesFinal.append(rip)
-         print("Total duplicate meshes skipped: {}".format(len(ripFiles) - len(ripFilesFinal)))
-      else:
-         ripFilesFinal = ripFiles
-         
-      for rip in ripFilesFinal:
-         mesh = RipMesh(rip)
-         mesh.loadMaterial(self.reuseMats, self.importShaders)
-         mesh.loadRip()
+      # RipProfile only keeps track of one import at a time
+      if ImportRIP.backgroundImport is not None:
+         self.report({'ERROR'}, "Another import is still running in the background, wait for it to finish or press Esc to cancel it")
+         return {'CANCELLED'}
+      self.steps = self.importSteps()
+      if self.asyncImport and context.window is not None:
+         ImportRIP.backgroundImport = self
+         # Runs the import a slice at a time from a timer, so Blender stays responsive, until modal() finishes it
+         windowManager = context.window_manager
+         windowManager.progress_begin(0, 100)
+         self.timer = windowManager.event_timer_add(self.timerInterval, window=context.window)
+         windowManager.modal_handler_add(self)
+         return {'RUNNING_MODAL'}
+      for progress in self.steps:
+         pass
       return {'FINISHED'}
+   
+   def modal(self, context, event):
+      if event.type == 'ESC':
+         # Closing the generator stops it where it is. What was already built stays, as one undo step.
+         self.steps.close()
+         self.endModal(context)
+         self.report({'WARNING'}, "Import cancelled, the meshes built so far were kept")
+         return {'FINISHED'}
+      if event.type != 'TIMER':
+         return {'PASS_THROUGH'}
+      sliceEnd = time.perf_counter() + self.timeSlice
+      try:
+         progress = next(self.steps)
+         while time.perf_counter() < sliceEnd:
+            progress = next(self.steps)
+      except StopIteration:
+         self.endModal(context)
+         return {'FINISHED'}
+      except Exception:
+         self.endModal(context)
+         traceback.print_exc()
+         self.report({'ERROR'}, "Import failed, see the system console for details")
+         return {'CANCELLED'}
+      context.window_manager.progress_update(int(progress * 100))
+      return {'RUNNING_MODAL'}
+   
+   def cancel(self, context):
+      # Blender cancels a running modal operator when it loads another file or closes the window. Closing the generator still saves the manifest and the profile.
+      self.steps.close()
+      self.endModal(context)
+   
+   def endModal(self, context):
+      ImportRIP.backgroundImport = None
+      context.window_manager.event_timer_remove(self.timer)
+      context.window_manager.progress_end()
+   
+   def importSteps(self):
+      """Runs the import as a generator, which does a small piece of the work (one file, mostly) for each item it yields
+      
+      Yields
+      ------
+      float
+         how much of the import is done, from 0 to 1
+      """
+      
+      profiler = RipProfile.begin(profileCalls=self.profiling == 'CPROFILE', traceMemory=self.profiling == 'MEMORY')
+      manifest = None
+      try:
+         with RipProfile.span("import"):
+            # Meshes of a capture share a handful of shaders, which only need to be parsed once
+            shaderRegistry = RipShaderRegistry()
+            ripFiles = [RipFile(self.filepath, shaderRegistry)]
+            if self.importAll:
+               for file in os.listdir(ripFiles[0].fileDir):
+                  if file != ripFiles[0].fileName and file.lower().endswith(".rip"):
+                     ripFiles.append(RipFile(os.path.join(ripFiles[0].fileDir, file), shaderRegistry))
+               # Keeps track of what happened to each file, so the next import of this folder can leave out what it already handled
+               manifest = RipManifest(ripFiles[0].fileDir)
+            numBefore = len(ripFiles)
+            
+            if manifest is not None and self.incremental:
+               ripFilesKept = []
+               for rip in ripFiles:
+                  reason = manifest.skipReason(rip.filePath, self.keep2D, self.keepUntextured, self.removeDuplicates, bpy.data.objects)
+                  if reason is None:
+                     ripFilesKept.append(rip)
+                  else:
+                     print("{}: skipping because {}".format(rip.fileLabel, reason))
+               ripFiles = ripFilesKept
+            
+            # Decide what to skip from the headers alone, so only the meshes that will be imported get their faces and vertices parsed.
+            ripFilesKept = []
+            for i in range(len(ripFiles)):
+               rip = ripFiles[i]
+               reason = rip.skipReason(self.keep2D, self.keepUntextured)
+               if reason is None:
+                  ripFilesKept.append(rip)
+               else:
+                  print("{}: skipping because {}".format(rip.fileLabel, reason))
+                  if manifest is not None:
+                     manifest.record(rip, reason)
+               yield 0.1 * i / len(ripFiles)
+            ripFiles = ripFilesKept
+            
+            # Parsing takes up the progress from 0.1 to 0.5, one file at a time, however the file gets parsed
+            parsedCount = 0
+            parseOptions = {'xyzOrder':self.xyzOrder, 'uvOrder':self.uvOrder, 'scale':self.scale, 'keep2D':self.keep2D, 'keepUntextured':self.keepUntextured, 'memoryMap':self.memoryMap}
+            # Huge meshes are streamed instead, which reads them a chunk at a time on the main thread while the mesh is built.
+            for rip in ripFiles:
+               if rip.vertexCount >= RipFile.streamingVertexCount:
+                  rip.parse(streaming=True, **parseOptions)
+                  parsedCount += 1
+                  yield 0.1 + 0.4 * parsedCount / len(ripFiles)
+            cache = RipCache() if self.useCache else None
+            ripFilesToParse = []
+            for rip in ripFiles:
+               if not rip.parsed:
+                  if cache is not None and cache.load(rip, parseOptions):
+                     parsedCount += 1
+                     yield 0.1 + 0.4 * parsedCount / len(ripFiles)
+                  else:
+                     ripFilesToParse.append(rip)
+            # Starting the worker processes only pays off for bigger captures
+            if self.parallelParse and RipPool.worthParallelParsing(ripFilesToParse):
+               # Blender 2.8x needs to be told where its Python interpreter is, later versions have it as sys.executable.
+               for done, parsed in RipPool.parseSteps(ripFilesToParse, executable=getattr(bpy.app, "binary_path_python", None), **parseOptions):
+                  yield 0.1 + 0.4 * (parsedCount + done) / len(ripFiles)
+            # Anything the worker processes couldn't handle is parsed here instead.
+            for rip in ripFilesToParse:
+               if not rip.parsed:
+                  rip.parse(**parseOptions)
+               if cache is not None and rip.parsed:
+                  cache.store(rip, parseOptions)
+               parsedCount += 1
+               yield 0.1 + 0.4 * parsedCount / len(ripFiles)
+            if cache is not None:
+               cache.evict()
+               print("Parse cache: {} hits, {} misses".format(cache.hits, cache.misses))
+            ripFiles = list(filter(lambda r: r.parsed, ripFiles))
+            print("Total RIP files skipped: {}".format(numBefore - len(ripFiles)))
+            
+            if self.removeDuplicates:
+               # One entry per fingerprint, holding whichever duplicate has the most textures so far. It stays where the first duplicate was found.
+               duplicates = {}
+               for rip in ripFiles:
+                  kept = duplicates.get(rip.fingerprint)
+                  if kept is None or len(rip.textures) > len(kept.textures):
+                     duplicates[rip.fingerprint] = rip
+               ripFilesFinal = list(duplicates.values())
+               if manifest is not None:
+                  for rip in ripFiles:
+                     if duplicates[rip.fingerprint] is not rip:
+                        manifest.record(rip, "duplicate")
+               print("Total duplicate meshes skipped: {}".format(len(ripFiles) - len(ripFilesFinal)))
+            else:
+               ripFilesFinal = ripFiles
+            
+            # The mesh datablock built for each geometryKey, which later files with the same geometry are linked to
+            instances = {}
+            # Each texture file is loaded once, no matter how many materials use it
+            textureRegistry = RipTextureRegistry()
+            # One material for each distinct RipFile.materialSignature, all built before the meshes that share them. This takes up the progress from 0.5 to 0.7.
+            materials = {}
+            if self.reuseMats:
+               batch = RipMaterial.batch(ripFilesFinal, self.importShaders)
+               print("Materials: {} needed for {} meshes".format(len(batch), len(ripFilesFinal)))
+               for signature in batch:
+                  materials[signature] = RipMaterial(batch[signature], textureRegistry).build(signature, self.reuseMats, self.importShaders)
+                  yield 0.5 + 0.2 * len(materials) / len(batch)
+            for i in range(len(ripFilesFinal)):
+               rip = ripFilesFinal[i]
+               mesh = RipMesh(rip, instances.get(rip.geometryKey) if self.instanceMeshes else None, textureRegistry)
+               mesh.loadMaterial(self.reuseMats, self.importShaders, materials)
+               mesh.loadRip()
+               instances.setdefault(rip.geometryKey, mesh.mesh)
+               if manifest is not None:
+                  manifest.record(rip, objectName=mesh.object.name)
+               yield 0.7 + 0.3 * (i + 1) / len(ripFilesFinal)
+            if self.instanceMeshes:
+               print("Meshes: {} built for {} objects".format(len(instances), len(ripFilesFinal)))
+            print("Textures: {} loaded, {} reused".format(textureRegistry.misses, textureRegistry.hits))
+            if self.importShaders:
+               print("Shaders: {} parsed for {} meshes".format(sum(shader.parsed for shader in shaderRegistry.shaders.values()), len(ripFilesFinal)))
+      finally:
+         # Also done when the import is cancelled or fails part way, so an incremental import can pick up where this one stopped, and the report shows how far it got
+         RipProfile.end()
+         if manifest is not None:
+            try:
+               manifest.save()
+            except OSError as e:
+               print("Could not write the manifest {} ({})".format(manifest.filePath, e))
+         print(profiler.summary())
+         if self.profiling != 'NONE':
+            reportPath = os.path.join(os.path.dirname(self.filepath), "ninjaripper_profile.json")
+            try:
+               profiler.writeReport(reportPath)
+               print("Profiling report written to {}".format(reportPath))
+            except OSError as e:
+               print("Could not write the profiling report {} ({})".format(reportPath, e))
 
 def menu_func_import(self, context):
    self.layout.operator(ImportRIP.bl_idname, text="NinjaRipper (.rip)")